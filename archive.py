@@ -0,0 +1,212 @@
+import os, sys, json, mmap, struct, zlib, tempfile
+from array import array
+from datetime import datetime
+
+import store
+
+# Value kinds for packed scores, so that ints, floats and infinities all survive a round trip exactly
+INT, FLOAT, INF = 0, 1, 2
+
+def pack_scores(scores) -> bytes:
+  """Packs a list of score tuples as a (count, width) header, a kind byte per value, and the values as doubles."""
+  width = len(scores[0]) if scores else 0
+  values = [v for s in scores for v in s]
+  kinds = array('B', [INF if v == float('inf') else INT if isinstance(v, int) else FLOAT for v in values])
+  doubles = array('d', [0.0 if k == INF else v for k, v in zip(kinds, values)])
+  if sys.byteorder != 'little':
+    doubles.byteswap()
+  return struct.pack('<IB', len(scores), width) + kinds.tobytes() + doubles.tobytes()
+
+def unpack_scores(data, offset=0):
+  """Unpacks scores packed by pack_scores, returning them as lists along with the offset past them."""
+  count, width = struct.unpack_from('<IB', data, offset)
+  offset += 5
+  n = count * width
+  kinds = array('B', data[offset:offset + n])
+  doubles = array('d', data[offset + n:offset + 9 * n])
+  if sys.byteorder != 'little':
+    doubles.byteswap()
+  values = [float('inf') if k == INF else int(v) if k == INT else v for k, v in zip(kinds, doubles)]
+  return [values[i * width:(i + 1) * width] for i in range(count)], offset + 9 * n
+
+class PickRecord():
+  """
+  Compact serialization of a pick, the attributes stored by Pick.save.
+  Scores are packed numeric arrays, everything else is a compact JSON header.
+  Attributes not known here are kept in extra, so no pick loses data.
+  Known attributes the pick doesn't have are left unset, so that an explicit None survives a round trip too.
+  """
+  __slots__ = ('day', 'puzzle', 'category', 'min_flag', 'flags', 'manifold', 'cat_long', 'min_long',
+               'cat_link', 'min_link', 'min_score', 'start_scores', 'end_scores', 'extra')
+  SCORES = ('start_scores', 'end_scores')
+
+  def __init__(self, pick):
+    self.extra = {}
+    for name, value in pick.items():
+      if name in self.__slots__[:-1]:
+        setattr(self, name, value)
+      else:
+        self.extra[name] = value
+
+  def known(self) -> list:
+    """The known attributes the pick has, None or not."""
+    return [name for name in self.__slots__[:-1] if hasattr(self, name)]
+
+  def to_dict(self) -> dict:
+    """The pick's attributes, as they would be loaded from its JSON. Missing attributes are left out."""
+    pick = {name: getattr(self, name) for name in self.known()}
+    pick.update(self.extra)
+    return pick
+
+  def pack(self) -> bytes:
+    # Score lists go in the packed arrays, unless they are None, which only the JSON header can say
+    scores = [name for name in self.SCORES if getattr(self, name, None) is not None]
+    header = {name: getattr(self, name) for name in self.known() if name not in scores}
+    header.update(self.extra)
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    present = sum(1 << i for i, name in enumerate(self.SCORES) if name in scores)
+    packed = [struct.pack('<BI', present, len(header)), header]
+    packed += [pack_scores(getattr(self, name) if name in scores else []) for name in self.SCORES]
+    return b''.join(packed)
+
+  @classmethod
+  def unpack(cls, data):
+    present, size = struct.unpack_from('<BI', data)
+    pick = json.loads(bytes(data[5:5 + size]))
+    offset = 5 + size
+    for i, name in enumerate(cls.SCORES):
+      scores, offset = unpack_scores(data, offset)
+      if present & 1 << i:
+        pick[name] = scores
+    return cls(pick)
+
+# A bundle is a header, an index of (day, kind, offset, length), then the entries.
+# Picks are zlib-compressed, charts are stored as-is since PNGs are already compressed.
+MAGIC = b'DPA1'
+HEADER = struct.Struct('<4sI')
+ENTRY = struct.Struct('<iBQI')
+PICK, CHART = 0, 1
+
+def month(day) -> str:
+  """The bundle name for an ordinal, e.g. '2023-02'."""
+  return f'{datetime.fromordinal(day):%Y-%m}'
+
+def write_bundle(path, picks, charts=None):
+  """
+  Writes a bundle of picks (ordinal to attribute dict) and charts (ordinal to PNG bytes) to path.
+  The file is written atomically, replacing any previous bundle.
+  """
+  entries = [(day, PICK, zlib.compress(PickRecord(pick).pack(), 9)) for day, pick in sorted(picks.items())]
+  entries += [(day, CHART, png) for day, png in sorted((charts or {}).items()) if png]
+  offset = HEADER.size + ENTRY.size * len(entries)
+  index = []
+  for day, kind, blob in entries:
+    index.append(ENTRY.pack(day, kind, offset, len(blob)))
+    offset += len(blob)
+  fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'wb') as file:
+      file.write(HEADER.pack(MAGIC, len(entries)))
+      file.writelines(index)
+      file.writelines(e[2] for e in entries)
+    os.replace(temp, path)
+  except BaseException:
+    os.remove(temp)
+    raise
+
+class Bundle():
+  """
+  Random access to a bundle without reading it whole, from a memory-mapped file or from bytes.
+  Use as a context manager to close the mapping.
+  """
+  def __init__(self, source):
+    if isinstance(source, (bytes, bytearray)):
+      self.file = None
+      self.data = memoryview(source)
+    else:
+      self.file = open(source, 'rb')
+      self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, count = HEADER.unpack_from(self.data)
+    if magic != MAGIC:
+      raise ValueError('Not a daily pareto bundle')
+    self.index = {}
+    for i in range(count):
+      day, kind, offset, length = ENTRY.unpack_from(self.data, HEADER.size + ENTRY.size * i)
+      self.index[kind, day] = (offset, length)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    if self.file is not None:
+      self.data.close()
+      self.file.close()
+      self.file = None
+
+  def days(self) -> list:
+    """The ordinals of the picks in the bundle."""
+    return sorted(day for kind, day in self.index if kind == PICK)
+
+  def chart_days(self) -> list:
+    """The ordinals of the charts in the bundle."""
+    return sorted(day for kind, day in self.index if kind == CHART)
+
+  def pick(self, day):
+    """The attributes of the pick for an ordinal, or None if the bundle doesn't have it."""
+    if (PICK, day) not in self.index:
+      return None
+    offset, length = self.index[PICK, day]
+    return PickRecord.unpack(zlib.decompress(self.data[offset:offset + length])).to_dict()
+
+  def chart(self, day):
+    """The results chart for an ordinal as PNG bytes, or None if the bundle doesn't have it."""
+    if (CHART, day) not in self.index:
+      return None
+    offset, length = self.index[CHART, day]
+    return bytes(self.data[offset:offset + length])
+
+def restore(dbx, db):
+  """
+  Pulls the monthly bundles on Dropbox into the local store, one download per month,
+  so that the per-day reconciliation afterwards only has to fetch days that aren't archived.
+  Bundles already imported with the same content hash are skipped, so a restart only costs the folder listing.
+  """
+  for entry in store.list_entries(dbx, db.prefix + '/archive'):
+    content_hash = getattr(entry, 'content_hash', None)
+    if content_hash and db.bundle_hash(entry.name) == content_hash:
+      continue
+    with store.DROPBOX_SECONDS.timer(op='download'):
+      data = dbx.files_download(f'{db.prefix}/archive/{entry.name}')[1].content
+    with Bundle(data) as bundle:
+      db.import_bundle(bundle)
+    if content_hash:
+      db.mark_bundle(entry.name, content_hash)
+
+def migrate(dbx, directory='archive'):
+  """
+  One-way migration of the per-day /picks/{day}.txt and /charts/{day}.png files into monthly bundles.
+  Bundles are written to directory and uploaded to /archive/{month}.bin, the per-day files are left in place.
+  """
+  import dropbox
+  months = {}
+  for i, folder in enumerate(('/picks', '/charts')):
+    for name in store.list_folder(dbx, folder):
+      day = int(name.split('.')[0])
+      months.setdefault(month(day), ({}, {}))[i][day] = name
+  os.makedirs(directory, exist_ok=True)
+  for key, (pick_names, chart_names) in sorted(months.items()):
+    picks = {day: json.loads(dbx.files_download(f'/picks/{name}')[1].content) for day, name in pick_names.items()}
+    charts = {day: dbx.files_download(f'/charts/{name}')[1].content for day, name in chart_names.items()}
+    path = os.path.join(directory, f'{key}.bin')
+    write_bundle(path, picks, charts)
+    with open(path, 'rb') as file:
+      dbx.files_upload(file.read(), f'/archive/{key}.bin', mode=dropbox.files.WriteMode.overwrite)
+    print(key, len(picks), 'picks', len(charts), 'charts')
+
+if __name__ == '__main__':
+  # Usage: python archive.py migrate [directory]
+  if sys.argv[1:2] == ['migrate']:
+    migrate(store.dropbox_client(), *sys.argv[2:3])
@@ -0,0 +1,105 @@
+import os, sys, json, time, asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import archive
+import charts
+import daily
+import store
+import zlbb
+from daily import Pick
+from metrics import log
+
+CHECKPOINT = 'backfill.json'
+
+def load_checkpoint(path, start, end) -> set:
+  """The days already rebuilt by an interrupted run over the same range."""
+  try:
+    with open(path, 'r') as file:
+      data = json.load(file)
+  except (FileNotFoundError, ValueError):
+    return set()
+  return set(data['done']) if (data['start'], data['end']) == (start, end) else set()
+
+def save_checkpoint(path, start, end, done):
+  temp = path + '.tmp'
+  with open(temp, 'w') as file:
+    json.dump({'start': start, 'end': end, 'done': sorted(done)}, file)
+  os.replace(temp, path)
+
+def report(rebuilt, failed, elapsed) -> str:
+  rate = rebuilt / elapsed if elapsed else 0
+  return f"Rebuilt {rebuilt} days in {elapsed:.1f}s ({rate:.2f} days/sec)" + (f", {failed} failed" if failed else "")
+
+async def backfill(start, end, concurrency=4, executor=None, checkpoint=None, config=None):
+  """
+  Rebuilds the end scores and results charts of every posted day of a daily from start to end (ordinals, inclusive).
+  The daily is the default one unless a config is given, its picks are read from and written to the config's store.
+  Up to `concurrency` days are worked on at once, records are fetched once per puzzle however many days picked it,
+  and charts are rendered in executor, the chart pool by default.
+  Progress is checkpointed after every day, so an interrupted run over the same range resumes where it stopped,
+  by default to CHECKPOINT for the default daily and to backfill-{name}.json for the others.
+  Returns the number of days rebuilt, the number that failed, and the time taken in seconds.
+  """
+  loop = asyncio.get_running_loop()
+  config = config or daily.default
+  if checkpoint is None:
+    checkpoint = CHECKPOINT if config is daily.default else f'backfill-{config.name}.json'
+  # Storing a chart marks its day as posted, so days that haven't been posted yet are left alone
+  last = config.store().last_posted()
+  end = start - 1 if last is None else min(end, last)
+  done = load_checkpoint(checkpoint, start, end)
+  semaphore = asyncio.Semaphore(concurrency)
+  records = {}
+
+  async def get_records(pick):
+    if pick.puzzle['id'] not in records:
+      records[pick.puzzle['id']] = asyncio.ensure_future(pick.get_records_async())
+    return await records[pick.puzzle['id']]
+
+  async def rebuild(day):
+    async with semaphore:
+      pick = await loop.run_in_executor(None, Pick.stored, day, config)
+      if pick is None:
+        return False
+      pick.track(pick.get_frontier(await get_records(pick)))
+      png = await charts.render_async(executor, **pick.chart_data())
+      pick.save()
+      pick.save_chart(png)
+      done.add(day)
+      save_checkpoint(checkpoint, start, end, done)
+      return True
+
+  begin = time.perf_counter()
+  results = await asyncio.gather(*(rebuild(d) for d in range(start, end + 1) if d not in done), return_exceptions=True)
+  elapsed = time.perf_counter() - begin
+  failed = [r for r in results if isinstance(r, Exception)]
+  for error in failed:
+    log.error('Backfilling a day failed', exc_info=error)
+  if not failed and os.path.isfile(checkpoint):
+    os.remove(checkpoint)
+  return sum(r is True for r in results), len(failed), elapsed
+
+def main(argv):
+  """Usage: python backfill.py START END [CONCURRENCY], with dates as YYYY-MM-DD."""
+  start, end = (datetime.strptime(d, '%Y-%m-%d').toordinal() for d in argv[:2])
+  concurrency = int(argv[2]) if len(argv) > 2 else 4
+  daily.dbx = store.dropbox_client()
+  daily.db = store.Store('picks.db')
+  archive.restore(daily.dbx, daily.db)
+  daily.db.reconcile(daily.dbx)
+
+  async def run():
+    try:
+      # Renders are spread over every core, unlike in the bot where they share one worker
+      with ProcessPoolExecutor(os.cpu_count()) as executor:
+        return await backfill(start, end, concurrency, executor)
+    finally:
+      await zlbb.client.close()
+
+  print(report(*asyncio.run(run())))
+  while daily.db.sync(daily.dbx):
+    pass
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
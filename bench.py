@@ -0,0 +1,295 @@
+"""
+Offline benchmarks for the hot paths of the bot, run against a local stand-in for zlbb and an in-memory Dropbox.
+
+Usage:
+  python bench.py [--repeat N] [--output FILE]   run everything and write the results as JSON
+  python bench.py record PUZZLE_ID NAME          save a live zlbb record set as fixture NAME
+
+Fixtures in bench_fixtures/ are used as-is, any of the default sizes missing there is generated with a fixed seed.
+"""
+import os, sys, json, time, email.utils, types, hashlib, tempfile, threading, platform, subprocess, contextlib
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import dropbox
+import numpy as np
+
+import charts
+import daily
+import frontier
+import store
+import zlbb
+from daily import Pick
+
+FIXTURE_DIR = 'bench_fixtures'
+# Record counts of the default fixtures, the largest being well past any real puzzle
+SIZES = {'small': 50, 'medium': 1000, 'large': 20000}
+# The fixture the store and announcement benchmarks pick from, and the day they pick for, fixed so that runs compare
+CYCLE_FIXTURE = 'medium'
+DAY = 738000
+# Requests made to the stand-ins over a run
+served = 0
+
+def generate(size, seed=0) -> list:
+  """Generates a zlbb-like record set, with metrics trading off against each other and some infinite rates."""
+  rng = np.random.default_rng(seed)
+  base = rng.lognormal(4, 0.6, (size, 4))
+  trade = rng.uniform(0.5, 2, (size, 4))
+  records = []
+  for (g, c, a, i), (tg, tc, ta, ti) in zip(base.astype(int) + 1, trade):
+    looping = rng.random() < 0.8
+    records.append({'score': {
+      'cost': int(g * tg) * 5, 'cycles': int(c * tc), 'area': int(a * ta), 'instructions': int(i * ti),
+      'height': int(rng.integers(1, 10)), 'width': float(rng.integers(2, 20)) / 2,
+      'rate': round(float(c * tc) / 6, 2) if looping else 'Infinity',
+      'areaINF': int(a * ta * 1.5) if looping else '∞',
+      'heightINF': int(rng.integers(1, 10)) if looping else None,
+      'widthINF': float(rng.integers(2, 20)) / 2 if looping else None,
+      'overlap': bool(rng.random() < 0.05), 'trackless': bool(rng.random() < 0.2)}})
+  return records
+
+def fixtures() -> dict:
+  """The record sets to benchmark by name, recorded ones from FIXTURE_DIR first."""
+  sets = {}
+  if os.path.isdir(FIXTURE_DIR):
+    for name in sorted(os.listdir(FIXTURE_DIR)):
+      if name.endswith('.json'):
+        with open(os.path.join(FIXTURE_DIR, name), 'r') as file:
+          sets[name[:-5]] = json.load(file)
+  for name, size in SIZES.items():
+    sets.setdefault(name, generate(size))
+  return sets
+
+def puzzles(names) -> list:
+  """A puzzle list for the stand-in, one puzzle per record set, spread over the three puzzle groups."""
+  groups = ['CHAPTER_1', 'JOURNAL_I', 'TOURNAMENT_2019']
+  return [{'id': name, 'displayName': name.title(), 'group': {'id': groups[i % 3]}, 'type': 'NORMAL'}
+          for i, name in enumerate(names)]
+
+class StandIn():
+  """
+  Local HTTP stand-in for the zlbb endpoints the bot uses, serving fixtures with ETags and Last-Modified.
+  Counts requests and keeps the headers of the last one, so that benchmarks and tests can see what went over the wire.
+  With etags off only Last-Modified is sent, to exercise revalidation by date alone.
+  Requests can be answered with error statuses first, and slowed down by a delay, to exercise retries and shared fetches.
+  """
+  def __init__(self, record_sets, etags=True):
+    bodies = {'/om/puzzles': json.dumps(puzzles(record_sets))}
+    for name, records in record_sets.items():
+      bodies[f'/om/puzzle/{name}/records'] = json.dumps(records)
+    self.bodies = {k: v.encode('utf-8') for k, v in bodies.items()}
+    self.etags = {k: '"' + hashlib.sha1(v).hexdigest() + '"' for k, v in self.bodies.items()} if etags else {}
+    self.last_modified = email.utils.formatdate(time.time() - 3600, usegmt=True)
+    self.requests = 0
+    self.headers = None
+    # Statuses the next requests are answered with instead, in order, e.g. [503, 429] to fail twice first
+    self.statuses = []
+    # Seconds every request waits before being answered
+    self.delay = 0
+    stand_in = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self):
+        stand_in.requests += 1
+        stand_in.headers = dict(self.headers)
+        time.sleep(stand_in.delay)
+        path = self.path.split('?')[0]
+        if stand_in.statuses:
+          self.send_response(stand_in.statuses.pop(0))
+          self.end_headers()
+        elif path not in stand_in.bodies:
+          self.send_response(404)
+          self.end_headers()
+        elif path in stand_in.etags and self.headers.get('If-None-Match') == stand_in.etags[path]:
+          self.send_response(304)
+          self.end_headers()
+        elif path not in stand_in.etags and self.headers.get('If-Modified-Since') == stand_in.last_modified:
+          self.send_response(304)
+          self.end_headers()
+        else:
+          self.send_response(200)
+          self.send_header('Content-Type', 'application/json')
+          self.send_header('Content-Length', str(len(stand_in.bodies[path])))
+          if path in stand_in.etags:
+            self.send_header('ETag', stand_in.etags[path])
+          self.send_header('Last-Modified', stand_in.last_modified)
+          self.end_headers()
+          self.wfile.write(stand_in.bodies[path])
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+  def __enter__(self):
+    threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    return self
+
+  def __exit__(self, *args):
+    self.server.shutdown()
+    self.server.server_close()
+
+class FakeDropbox():
+  """
+  In-memory stand-in for the parts of the Dropbox client the bot uses.
+  Folder listings come in pages of `page` entries like the real API's, so list_folder's continue path gets exercised.
+  """
+  def __init__(self, page=100):
+    self.files = {}
+    self.calls = 0
+    self.page = page
+
+  def files_upload(self, data, path, mode=None):
+    self.calls += 1
+    self.files[path] = bytes(data)
+
+  def files_download(self, path):
+    self.calls += 1
+    if path not in self.files:
+      raise dropbox.exceptions.ApiError('bench', 'not_found', None, None)
+    return None, types.SimpleNamespace(content=self.files[path])
+
+  def list_page(self, path, offset):
+    names = sorted(k[len(path) + 1:] for k in self.files if k.startswith(path + '/'))
+    # Not Dropbox's block hash, but like it, it changes whenever the content does
+    entries = [types.SimpleNamespace(name=n, content_hash=hashlib.sha256(self.files[f'{path}/{n}']).hexdigest())
+               for n in names[offset:offset + self.page]]
+    more = offset + self.page < len(names)
+    return types.SimpleNamespace(entries=entries, has_more=more, cursor=(path, offset + self.page) if more else None)
+
+  def files_list_folder(self, path):
+    self.calls += 1
+    return self.list_page(path, 0)
+
+  def files_list_folder_continue(self, cursor):
+    self.calls += 1
+    return self.list_page(*cursor)
+
+def timeit(function, repeat) -> dict:
+  """Times repeated calls, in seconds."""
+  times = []
+  for _ in range(repeat):
+    begin = time.perf_counter()
+    function()
+    times.append(time.perf_counter() - begin)
+  return {'repeat': repeat, 'min': min(times), 'median': statistics.median(times), 'mean': statistics.mean(times)}
+
+def bench_frontier(record_sets, repeat) -> dict:
+  results = {}
+  for name, records in record_sets.items():
+    table = frontier.Records(records)
+    results[f'records/{name}'] = timeit(lambda: frontier.Records(records), repeat)
+    results[f'frontier_2d/{name}'] = timeit(lambda: table.frontier(['cost', 'cycles']), repeat)
+    results[f'frontier_3d/{name}'] = timeit(lambda: table.frontier(['cost', 'cycles'], 'A', 'area'), repeat)
+  return results
+
+def bench_reroll(record_sets, repeat) -> dict:
+  results = {}
+  for name, records in record_sets.items():
+    table = frontier.Records(records)
+    pick = Pick.__new__(Pick)
+    pick.puzzle = puzzles([name])[0]
+    rng = np.random.default_rng(0)
+    results[f'roll/{name}'] = timeit(lambda: pick.roll(table, rng), repeat)
+    # Each record set gets a stand-in of its own, so the puzzle timed is always the same one
+    with serving({name: records}):
+      pick = Pick.__new__(Pick)
+      # The first call fills the cache, the rest are what a reroll costs with it warm
+      results[f'random/{name}/cold'] = timeit(lambda: pick.random(reload=True), 1)
+      results[f'random/{name}/warm'] = timeit(pick.random, repeat)
+  return results
+
+def bench_chart(record_sets, repeat) -> dict:
+  results = {}
+  for name, records in record_sets.items():
+    scores = frontier.Records(records).frontier(['cost', 'cycles'])[0]
+    data = {'title': name, 'xlabel': 'G', 'ylabel': 'C', 'dead': scores[::2], 'keep': scores[1::2], 'new': scores[:3]}
+    results[f'render/{name}'] = timeit(lambda: charts.render(**data), repeat)
+  return results
+
+def bench_store(repeat) -> dict:
+  day = DAY
+  pick = Pick(day)
+  results = {
+    'load': timeit(lambda: Pick.stored(day), repeat),
+    'save/unchanged': timeit(pick.save, repeat),
+  }
+  def changed():
+    pick.start_scores = pick.start_scores[::-1]
+    pick.save()
+  results['save/changed'] = timeit(changed, repeat)
+  results['sync'] = timeit(lambda: daily.db.sync(daily.dbx), repeat)
+  # A few years of dailies take several pages to list. They go in a folder of their own, so the bench picks stay loadable.
+  for i in range(1000):
+    daily.dbx.files[f'/listing/{day - i}.txt'] = b'{}'
+  results['list_folder'] = timeit(lambda: store.list_folder(daily.dbx, '/listing'), repeat)
+  return results
+
+def bench_cycle(repeat) -> dict:
+  """The synchronous core of an announcement: yesterday's and today's picks, and both charts."""
+  day = DAY
+  def cycle():
+    for pick in (Pick(day - 1), Pick(day)):
+      pick.save_chart(pick.make_chart())
+  return {'announcement': timeit(cycle, repeat)}
+
+def revision() -> str:
+  try:
+    return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+@contextlib.contextmanager
+def serving(record_sets):
+  """Points zlbb at a stand-in serving the record sets for the duration, counting its requests in `served`."""
+  global served
+  url = zlbb.ZLBB_URL
+  with StandIn(record_sets) as stand_in:
+    zlbb.ZLBB_URL = stand_in.url
+    try:
+      yield stand_in
+    finally:
+      zlbb.ZLBB_URL = url
+      served += stand_in.requests
+
+def run(repeat=5) -> dict:
+  global served
+  served = 0
+  record_sets = fixtures()
+  # Picks are rolled with a fixed seed, so that every run times the same picks
+  daily.SEED = 0
+  with tempfile.TemporaryDirectory() as directory:
+    zlbb.cache = zlbb.Cache(os.path.join(directory, 'cache'))
+    daily.dbx = FakeDropbox()
+    daily.db = store.Store(os.path.join(directory, 'picks.db'))
+    results = {}
+    results.update(bench_frontier(record_sets, repeat))
+    results.update(bench_reroll(record_sets, repeat))
+    results.update(bench_chart(record_sets, repeat))
+    # The store and the announcement are timed on one puzzle of typical size
+    with serving({CYCLE_FIXTURE: record_sets[CYCLE_FIXTURE]}):
+      results.update(bench_store(repeat))
+      results.update(bench_cycle(repeat))
+    return {'revision': revision(), 'python': platform.python_version(), 'time': time.time(),
+            'fixtures': {name: len(records) for name, records in record_sets.items()},
+            'requests': served, 'dropbox_calls': daily.dbx.calls, 'cache': zlbb.cache.stats(),
+            'results': results}
+
+def record(puzzle_id, name):
+  """Saves a live zlbb record set as a fixture."""
+  os.makedirs(FIXTURE_DIR, exist_ok=True)
+  with open(os.path.join(FIXTURE_DIR, f'{name}.json'), 'w') as file:
+    json.dump(zlbb.get_json(f'/om/puzzle/{puzzle_id}/records?includeFrontier=true', True), file)
+
+if __name__ == '__main__':
+  args = sys.argv[1:]
+  if args[:1] == ['record']:
+    record(*args[1:3])
+  else:
+    options = dict(zip(args[::2], args[1::2]))
+    output = json.dumps(run(int(options.get('--repeat', 5))), indent=2)
+    if '--output' in options:
+      with open(options['--output'], 'w') as file:
+        file.write(output + '\n')
+    else:
+      print(output)
@@ -0,0 +1,68 @@
+import io, asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Renders are CPU-bound, a single worker keeps them off the event loop without competing with each other.
+# The bot only renders a couple of charts a day, so a thread is enough: a worker process would keep its own copy of
+# matplotlib resident for good, and forking the bot once its Discord, metrics and executor threads are running is unsafe.
+# Bulk renders like the backfill CLI pass a process pool to render_async instead.
+pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='charts')
+
+# Only renders in this process are counted, the backfill's process pool keeps its own
+RENDER_SECONDS = metrics.histogram('chart_render_seconds', 'Time to render a results chart.')
+
+@functools.lru_cache(maxsize=None)
+def setup():
+  """
+  Imports matplotlib on the first render rather than with this module, since it is the slowest import of the bot.
+  The style is global state, so it is set once here and never touched while rendering.
+  """
+  import matplotlib
+  import matplotlib.style
+  import matplotlib.ticker
+  import matplotlib.figure
+  import matplotlib.backends.backend_agg
+  matplotlib.style.use('dark_background')
+  matplotlib.rcParams['font.size'] = 18
+  return matplotlib
+
+def render(title, xlabel, ylabel, dead=(), keep=(), new=(), gone=()) -> bytes:
+  """
+  Renders the results chart for a pick and returns it as PNG bytes.
+  Starting points are red, hollow once dominated, and new points are green, faded once dominated themselves.
+  Uses the object-oriented Agg API, so no pyplot state is involved and the figure is freed once this returns.
+  """
+  matplotlib = setup()
+  with RENDER_SECONDS.timer():
+    fig = matplotlib.figure.Figure(figsize=(8, 6), layout='tight')
+    matplotlib.backends.backend_agg.FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    ax.grid(True, which='both', alpha=.25)
+    ax.loglog()
+    ax.spines['top'].set_visible(False)
+    ax.spines['right'].set_visible(False)
+
+    # Adds additional gridlines, though this might sometimes cause overlap in tick labels
+    ax.xaxis.set_major_formatter(matplotlib.ticker.ScalarFormatter())
+    ax.xaxis.set_minor_formatter(matplotlib.ticker.ScalarFormatter())
+    ax.yaxis.set_major_formatter(matplotlib.ticker.ScalarFormatter())
+    ax.yaxis.set_minor_formatter(matplotlib.ticker.ScalarFormatter())
+
+    if len(dead): ax.plot(*zip(*dead), 'ro', ms=8, fillstyle='none')
+    if len(keep): ax.plot(*zip(*keep), 'ro', ms=8)
+    if len(gone): ax.plot(*zip(*gone), 'go', ms=8, fillstyle='none', alpha=.5)
+    if len(new): ax.plot(*zip(*new), 'go', ms=8)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    fig.clear()
+    return buffer.getvalue()
+
+async def render_async(executor=None, **kwargs) -> bytes:
+  """Renders a chart in the chart pool, or the given executor, without blocking the event loop."""
+  loop = asyncio.get_running_loop()
+  return await loop.run_in_executor(executor or pool, functools.partial(render, **kwargs))
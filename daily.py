@@ -0,0 +1,406 @@
+import json, time, asyncio
+import discord
+from pprint import pformat
+from datetime import datetime,timedelta,timezone
+
+import numpy as np
+
+import charts
+import frontier
+import metrics
+from metrics import log
+import store
+import zlbb
+
+FRONTIER_SECONDS = metrics.histogram('frontier_seconds', 'Time to filter a puzzle\'s records down to a pick\'s frontier.')
+ROLLS = metrics.histogram('rolls_per_pick', 'Category rolls needed before one had a frontier.', (1, 2, 3, 5, 10, 20, 50, 100))
+
+# The Dropbox client and the local pick store, set by whichever entry point is running (see main.py)
+dbx = None
+db = None
+
+class Config():
+  """
+  The settings of one daily: where it is posted, at what hour (UTC) it is announced, and how its picks are weighted.
+  Puzzle groups are weighted by a substring of their id, categories by letter, separately for production puzzles.
+  Every daily but the default one keeps its picks in its own store, set by the entry point like the module-level one.
+  """
+  GROUPS = {'CHAPTER': 3, 'JOURNAL': 2, 'TOURNAMENT': 1}
+  CATEGORIES = {'NORMAL': {'G': 3, 'C': 3, 'A': 2, 'I': 3, 'H': 1, 'W': 1},
+                'PRODUCTION': {'G': 1, 'C': 1, 'A': 1, 'I': 1, 'H': 0, 'W': 0}}
+
+  def __init__(self, name='default', guild=None, channel=None, thread=None, hour=12, groups=None, categories=None):
+    self.name = name
+    self.guild = guild
+    self.channel = channel
+    self.thread = thread
+    self.hour = hour
+    self.groups = groups or self.GROUPS
+    self.categories = {**self.CATEGORIES, **(categories or {})}
+    self.db = None
+
+  @classmethod
+  def from_dict(cls, data):
+    """Builds a config from an entry of the dailies file, IDs may be given as strings or numbers."""
+    config = cls(data['name'], int(data['guild']), int(data['channel']), int(data['thread']), data.get('hour', 12),
+                 data.get('groups'), data.get('categories'))
+    config.validate()
+    return config
+
+  def validate(self):
+    """
+    Raises ValueError for weights no pick could be rolled with, which would otherwise only show up
+    as a daily rerolling forever when it is due: a category needs 3 weighted metrics, and a puzzle a weighted group.
+    """
+    if not isinstance(self.hour, int) or not 0 <= self.hour < 24:
+      raise ValueError(f'Daily {self.name}: hour must be a whole hour from 0 to 23, not {self.hour!r}')
+    if any(not isinstance(w, (int, float)) or w < 0 for w in self.groups.values()):
+      raise ValueError(f'Daily {self.name}: group weights must be non-negative numbers')
+    if not any(self.groups.values()):
+      raise ValueError(f'Daily {self.name}: at least one puzzle group needs a weight above zero')
+    for kind, weights in self.categories.items():
+      if kind not in self.CATEGORIES:
+        raise ValueError(f'Daily {self.name}: unknown category weights {kind!r}, expected NORMAL or PRODUCTION')
+      if any(m not in self.CATEGORIES['NORMAL'] for m in weights):
+        raise ValueError(f'Daily {self.name}: {kind} weights metrics other than {"".join(self.CATEGORIES["NORMAL"])}')
+      if any(not isinstance(w, (int, float)) or w < 0 for w in weights.values()):
+        raise ValueError(f'Daily {self.name}: {kind} weights must be non-negative numbers')
+      # Each pick rolls 2 metrics for its category and a third for its min flag, all different
+      if sum(1 for w in weights.values() if w) < 3:
+        raise ValueError(f'Daily {self.name}: {kind} weights need at least 3 metrics above zero')
+
+  def store(self):
+    """The store of the daily's picks, the module-level one for the default daily."""
+    return self.db or db
+
+  def next_announcement(self, now) -> datetime:
+    """
+    When the daily is next announced, tomorrow if today's results are already out,
+    unless they went out without today's announcement, which is then still due.
+    """
+    ordinal = now.toordinal()
+    db = self.store()
+    pending = db.posted(ordinal - 1, 'results') and not db.posted(ordinal, 'announcement')
+    day = ordinal + (db.last_posted() == ordinal - 1 and not pending)
+    return datetime.fromordinal(day).replace(tzinfo=timezone.utc) + timedelta(hours=self.hour)
+
+default = Config()
+
+# Seed of the rng picks are rolled with, None for a fresh one every time. The bench fixes it so that its runs compare.
+SEED = None
+
+# Records tables being fetched, so that dailies landing on the same puzzle at once share one fetch and one table
+pending = {}
+
+async def shared_records(path, reload=False):
+  """Fetches a puzzle's records as a table, joining a fetch of the same path already in flight."""
+  if path not in pending:
+    async def fetch():
+      try:
+        return frontier.Records(await zlbb.client.get_json(path, reload))
+      finally:
+        pending.pop(path, None)
+    pending[path] = asyncio.ensure_future(fetch())
+  return await asyncio.shield(pending[path])
+
+def normed(x):
+  """Convenience function to reduce a positive array to percentages."""
+  return x / np.sum(x)
+
+def score_string(scores, category) -> str:
+  """Power one-liner to make a score string out of scores, looks like '100a/90b, 89a/80b', etc."""
+  return ', '.join(['/'.join([''.join(z) for z in zip(map(str, s), category.lower())]) for s in scores])
+
+class Pick():
+  """
+  The default class used to generate, store, and load the pick for the daily pareto.
+  All attributes should be JSON-handleable, except for the daily's config which is never saved.
+  """
+  config = default
+
+  def __init__(self, ordinal, reroll=False, config=None):
+    """
+    Load or generate a pick based on its ordinal, the number of days since 01-01-0001
+    End scores will be from start scores after the initial generation assuming submissions have been made.
+    """
+    self.day = ordinal
+    if config is not None:
+      self.config = config
+    if reroll or not self.load():
+      self.start_scores = self.random()
+      self.db.clear_deltas(self.day)
+    self.track(self.get_frontier())
+    self.save()
+
+  @classmethod
+  async def create(cls, ordinal, reroll=False, config=None):
+    """
+    Async version of constructing a pick, for use inside the bot.
+    zlbb is fetched through the pooled client and Dropbox in a worker thread, so the event loop is never blocked.
+    """
+    self = cls.__new__(cls)
+    self.day = ordinal
+    if config is not None:
+      self.config = config
+    loop = asyncio.get_running_loop()
+    if reroll or not await loop.run_in_executor(None, self.load):
+      self.start_scores = await self.random_async()
+      self.db.clear_deltas(self.day)
+    self.track(self.get_frontier(await self.get_records_async()))
+    await loop.run_in_executor(None, self.save)
+    return self
+
+  @classmethod
+  def stored(cls, ordinal, config=None):
+    """Loads an existing pick without generating or refreshing anything, returns None if there isn't one."""
+    self = cls.__new__(cls)
+    self.day = ordinal
+    if config is not None:
+      self.config = config
+    return self if self.load() else None
+
+  def __repr__(self):
+    """Printing a pick object will provide the pprint formatted version of its attributes"""
+    return pformat(self.__dict__)
+
+  @property
+  def db(self):
+    """The store of the pick's daily."""
+    return self.config.store()
+
+  def load(self) -> bool:
+    """Tries to load the pick from the local store, then from Dropbox, if both fail, return False."""
+    data_json = self.db.get(self.day)
+    if data_json is None:
+      import dropbox
+      try:
+        with store.DROPBOX_SECONDS.timer(op='download'):
+          data = dbx.files_download(f"{self.db.prefix}/picks/{self.day}.txt")[1]
+        data_json = json.loads(data.content)
+      except dropbox.exceptions.ApiError:
+        return False
+      self.db.put(self.day, data_json, dirty=False)
+    for i in data_json:
+      self.__dict__[i] = data_json[i]
+    return True
+
+  def save(self) -> bool:
+    """
+    Saves the pick to the local store, from where it is backed up to Dropbox on the next sync.
+    Returns False if nothing changed since it was last saved, in which case nothing is written.
+    """
+    return self.db.put(self.day, {k: v for k, v in self.__dict__.items() if k != 'config'})
+
+  def random(self,reload=False):
+    """
+    Generate a pick composed of puzzle and category based on weighted probabilities.
+    Also retrieves currently available scores related to the pick.
+    """
+    # Loads the puzzles from zlbb through the cache, or reloads them if desired.
+    puzzles = zlbb.get_json('/om/puzzles', reload)
+    rng = np.random.default_rng(SEED)
+    scores = None
+    while scores is None:
+      # The records are fetched once per puzzle, every rolled category is then checked against them locally.
+      self.choose_puzzle(puzzles, rng)
+      scores = self.roll(self.get_records(reload), rng)
+    return scores
+
+  async def random_async(self, reload=False):
+    """Async version of random, fetching through the pooled zlbb client."""
+    puzzles = await zlbb.client.get_json('/om/puzzles', reload)
+    rng = np.random.default_rng(SEED)
+    scores = None
+    while scores is None:
+      self.choose_puzzle(puzzles, rng)
+      scores = self.roll(await self.get_records_async(reload), rng)
+    return scores
+
+  def choose_puzzle(self, puzzles, rng):
+    """Picks the puzzle, weighted by puzzle group as set in the daily's config."""
+    # TODO: filter out puzzles like stab water
+    # By default the stock puzzles are given more precedence than journal puzzles due to ease and familiarity
+    groups = [(tuple(filter(lambda x: g in x['group']['id'], puzzles)), w) for g, w in self.config.groups.items()]
+    groups = [(p, w) for p, w in groups if p and w]
+    grouped_puzzles = np.array([p for p, _ in groups], dtype=object)
+    grouped_puzzles_weight = normed([w for _, w in groups])
+    self.puzzle = rng.choice(rng.choice(grouped_puzzles, p=grouped_puzzles_weight))
+
+  def roll(self, records, rng):
+    """
+    Rolls the category, flags and manifold for the chosen puzzle, checking each roll against its records.
+    Returns the starting scores, or None if no category can be made for the puzzle at all.
+    """
+    # Height and Width are unavailable in production since all solutions will be identical (or cheated) there
+    # FUTURE: Account for manifold split
+    categories = ['G', 'C', 'A', 'I', 'H', 'W']
+    categories_weight = [[self.config.categories[t].get(c, 0) for c in categories] for t in ('NORMAL', 'PRODUCTION')]
+    catmap = [{'G':'cost', 'C':'cycles', 'A':'area', 'I':'instructions', 'H':'height', 'W':'width'},
+              {'G':'cost', 'R':'rate', 'A':'areaINF', 'I':'instructions', 'H':'heightINF', 'W':'widthINF'}]
+    
+    catlink = [{'G':'g', 'C':'c', 'A':'a', 'I':'i', 'H':'h', 'W':'w'},
+               {'G':'g', 'R':'r', 'A':'aI', 'I':'i', 'H':'hI', 'W':'wI'}]
+
+    # Metrics with no scores for the puzzle are removed from the weights, for each manifold separately.
+    weights = [[w * (catmap[mani][c.replace('C','R') if mani else c] in records.available)
+                for c, w in zip(categories, categories_weight[self.puzzle['type'] == 'PRODUCTION'])]
+               for mani in (0, 1)]
+    manifold_weight = [0.7 * (np.count_nonzero(weights[0]) >= 3), 0.3 * (np.count_nonzero(weights[1]) >= 3)]
+    if not any(manifold_weight):
+      return None
+
+    scores = None
+    rolls = 0
+    while not scores:
+      rolls += 1
+      # If a bad category is rolled, scores will be empty, so this process repeats until a good category is rolled.
+      # The "min_flag" should be unique from the category, so they are generated together.
+      # Each of the flags O, T, and min_flag, have a small chance of being added to the category thereafter.
+      self.manifold = rng.choice(['V', 'INF'], p=normed(manifold_weight))
+      mani_bool = self.manifold == 'INF'
+      probs = normed(weights[mani_bool])
+      metrics = ''.join(rng.choice(categories, 3, False, p=probs))
+      self.category, self.min_flag = ''.join(sorted(metrics[:2],key=lambda x: categories.index(x))), metrics[2]
+      self.flags = ''.join(
+        (rng.choice(['', 'O'], p=[0.99,0.01]),
+         rng.choice(['', 'T'], p=[0.9, 0.1]),
+         rng.choice(['', self.min_flag], p=[0.85, 0.15])))
+      
+      if mani_bool: self.category = self.category.replace('C','R')
+      if mani_bool: self.min_flag = self.min_flag.replace('C','R')
+      if mani_bool: self.flags = self.flags.replace('C','R')
+      self.cat_long = [catmap[mani_bool][i] for i in self.category]
+      self.min_long = catmap[mani_bool][self.min_flag]
+      self.cat_link = [catlink[mani_bool][i] for i in self.category]
+      self.min_link = catlink[mani_bool][self.min_flag]
+
+      scores = self.get_frontier(records)
+      log.debug('Rolled %s(%s)@%s for %s: %s', self.flags, self.category, self.manifold, self.puzzle['id'], scores)
+    ROLLS.observe(rolls)
+    return scores
+
+  def records_path(self) -> str:
+    return f'/om/puzzle/{self.puzzle["id"]}/records?includeFrontier=true'
+
+  def get_records(self, reload=False):
+    """Fetches every record of the pick's puzzle from zlbb, as a columnar table."""
+    return frontier.Records(zlbb.get_json(self.records_path(), reload))
+
+  async def get_records_async(self, reload=False):
+    """Async version of get_records, sharing the fetch with any other daily on the same puzzle."""
+    return await shared_records(self.records_path(), reload)
+
+  def get_frontier(self, records=None):
+    """
+    Gets the entire pareto frontier from zlbb, unless the records are already at hand,
+    and filters it down to just the category the pick is working with.
+    """
+    if records is None:
+      records = self.get_records()
+    min_long = self.min_long if self.min_flag in self.flags else None
+    with FRONTIER_SECONDS.timer(category=self.category):
+      scores, min_score = records.frontier(self.cat_long, self.flags, min_long)
+    if min_long:
+      self.min_score = min_score
+    return scores
+
+  def replay(self):
+    """
+    Replays the stored deltas over the start scores.
+    Returns the current frontier and every point that was ever added to it, as sets of tuples.
+    """
+    current = set(map(tuple, self.start_scores))
+    seen = set()
+    for _, added, dominated in self.db.deltas(self.day):
+      current.difference_update(dominated)
+      current.update(added)
+      seen.update(added)
+    return current, seen
+
+  def track(self, scores):
+    """
+    Sets the end scores to a freshly fetched frontier, storing only how it moved since the last update.
+    Returns the points added and the points they dominated, both empty if nothing changed.
+    """
+    current, _ = self.replay()
+    scores = set(map(tuple, scores))
+    added, dominated = sorted(scores - current), sorted(current - scores)
+    if added or dominated:
+      self.db.add_delta(self.day, time.time(), added, dominated)
+    self.end_scores = sorted(scores)
+    return added, dominated
+
+  def get_discord_announcement(self,auto=True):
+    """Generates a Discord embed for the bot to post indicating the category for the day."""
+    date = datetime.fromordinal(self.day)
+    filename = 'today.png'
+    scores = score_string(self.start_scores, self.category)
+    link = self.get_leaderboard_link()
+    if auto:
+      embed = discord.Embed(color=discord.Color.dark_gold(),
+                            title=f"Daily Pareto for {date:%B %d, %Y}",
+                            description=f"{self.flags}({self.category})@{self.manifold} for {self.puzzle['displayName']}: [zlbb 🔗]({link})\n```{scores}```",
+                            timestamp=date.replace(tzinfo=timezone.utc) + timedelta(hours=self.config.hour))
+      embed.set_image(url=f'attachment://{filename}')
+      return embed
+    else:
+      return f"```Daily Pareto for {date:%B %d, %Y}:\n{self.flags}({self.category})@{self.manifold} for {self.puzzle['displayName']}\n{scores}```\n<{link}>\n"
+
+  
+  def get_results_post(self,submitters,auto=True):
+    """Generates a Discord embed for the bot to post indicating the results for yesterday."""
+    date = datetime.fromordinal(self.day)
+    filename = 'yesterday.png'
+    description = f"Submissions by {', '.join(sorted(submitters))}" if submitters else "No submissions"
+    if auto:
+      embed = discord.Embed(color=discord.Color.gold(),
+                            title=f"Daily Pareto Results for {date:%B %d, %Y}", 
+                            description=description)
+      embed.set_image(url=f'attachment://{filename}')
+      return embed
+  
+  def get_leaderboard_link(self):
+    """Generates a URL link to zlbb based on puzzle, category, and set flags."""
+    link = f'https://zlbb.faendir.com/puzzles/{self.puzzle["id"]}/visualizer?visualizerFilter-{self.puzzle["id"]}.showOnlyFrontier=true&visualizerConfig.mode=2D&visualizerConfig.x={self.cat_link[0]}&visualizerConfig.y={self.cat_link[1]}'
+    if 'O' not in self.flags:
+      link += f'&visualizerFilter-{self.puzzle["id"]}.modifiers.overlap=false'
+    if 'T' in self.flags:
+      link += f'&visualizerFilter-{self.puzzle["id"]}.modifiers.trackless=true'
+    if self.min_flag in self.flags:
+      link += f'&visualizerFilter-{self.puzzle["id"]}.range.{self.min_link}.max={self.min_score}'
+    return link
+
+  def chart_data(self) -> dict:
+    """
+    The title, labels and point sets for the results chart, built from the stored frontier deltas:
+    starting points that were dominated or kept, new points still on the frontier, and new points since dominated.
+    """
+    date = datetime.fromordinal(self.day)
+    start = set(map(tuple, self.start_scores))
+    end, seen = self.replay()
+
+    # Infinities are not handled presently, perhaps in the future.
+    finite = lambda points: sorted(p for p in points if np.inf not in p)
+    # TODO: if minflag is set, handle case where min is improved
+    return {'title': f"{self.flags}({self.category})@{self.manifold} for {self.puzzle['displayName']} {date:%Y-%m-%d} ",
+            'xlabel': self.category[0],
+            'ylabel': self.category[1],
+            'dead': finite(start - end),
+            'keep': finite(start & end),
+            'new': finite(end - start),
+            'gone': finite(seen - end - start)}
+
+  def make_chart(self) -> bytes:
+    """
+    Generates a plot showing the results of the daily, comparing current scores to starting scores.
+    Returns the chart as PNG bytes.
+    """
+    return charts.render(**self.chart_data())
+
+  async def make_chart_async(self) -> bytes:
+    """Async version of make_chart, rendering in the chart pool."""
+    return await charts.render_async(**self.chart_data())
+
+  def save_chart(self, png):
+    """Saves a results chart to the local store, from where it is backed up to Dropbox on the next sync."""
+    self.db.put_chart(self.day, png)
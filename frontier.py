@@ -0,0 +1,102 @@
+import numpy as np
+
+# zlbb reports unbounded metrics (e.g. rate or areaINF of a non-repeating solution) as a string
+INFINITIES = ('∞', 'Infinity')
+
+def as_float(value) -> float:
+  """Converts a single zlbb score value to a float, with None as NaN and the infinity strings as inf."""
+  if value is None:
+    return np.nan
+  if value in INFINITIES:
+    return np.inf
+  return float(value)
+
+def _sweep(points):
+  """
+  Skyline of lexicographically sorted, unique 2D points.
+  A point survives only if it is strictly lower than every point before it.
+  """
+  prev = np.minimum.accumulate(points[:, 1])
+  mask = np.empty(len(points), dtype=bool)
+  mask[0] = True
+  mask[1:] = points[1:, 1] < prev[:-1]
+  return mask
+
+def _filter(points):
+  """
+  Sort-filter skyline of lexicographically sorted, unique points in any dimension.
+  Since a dominating point always sorts earlier, each point only has to be checked against the skyline so far.
+  """
+  mask = np.zeros(len(points), dtype=bool)
+  window = np.empty_like(points)
+  size = 0
+  for i, p in enumerate(points):
+    if not np.any(np.all(window[:size] <= p, axis=1)):
+      window[size] = p
+      size += 1
+      mask[i] = True
+  return mask
+
+def skyline(points) -> np.ndarray:
+  """
+  Returns the row indices of the pareto frontier of an (n, d) array, lower being better.
+  A point is dropped if any other distinct point is no worse in every metric, the same as the old pareto_compare.
+  Duplicate points are only reported once, rows containing NaN are ignored, and the result is in lexicographic order.
+  """
+  points = np.asarray(points, dtype=float)
+  valid = np.flatnonzero(~np.isnan(points).any(axis=1))
+  if not len(valid):
+    return valid
+  unique, first = np.unique(points[valid], axis=0, return_index=True)
+  if unique.shape[1] == 1:
+    mask = np.arange(len(unique)) == 0
+  elif unique.shape[1] == 2:
+    mask = _sweep(unique)
+  else:
+    mask = _filter(unique)
+  return valid[first[mask]]
+
+def scores(records, columns, index) -> list:
+  """Builds the score tuples stored on a pick from the selected records, with infinities as np.inf."""
+  return [tuple(np.inf if records[i]['score'][c] in INFINITIES else records[i]['score'][c] for c in columns)
+          for i in index]
+
+class Records():
+  """
+  Columnar table of a puzzle's zlbb records, one float array per metric plus the overlap/trackless flags.
+  Built once per puzzle so that every rolled category can be checked against it without going back to zlbb.
+  """
+  def __init__(self, records):
+    self.records = records
+    metrics = sorted({k for r in records for k in r['score']} - {'overlap', 'trackless'})
+    self.columns = {m: np.array([as_float(r['score'].get(m)) for r in records], dtype=float) for m in metrics}
+    self.overlap = np.array([r['score']['overlap'] == True for r in records], dtype=bool)
+    self.trackless = np.array([r['score']['trackless'] == True for r in records], dtype=bool)
+    # Metrics that no record has a value for can never form a frontier
+    self.available = {m for m in metrics if not np.isnan(self.columns[m]).all()}
+
+  def __len__(self):
+    return len(self.records)
+
+  def frontier(self, columns, flags='', min_column=None):
+    """
+    Filters the table by flags ('O' allows overlap, 'T' requires trackless) and returns the frontier in columns.
+    If min_column is given, only the frontier at the minimum of that metric is kept, and the minimum is returned too.
+    Returns a tuple of (scores, min_score), with min_score None if min_column is not given or nothing is left.
+    """
+    if any(c not in self.available for c in columns) or (min_column and min_column not in self.available):
+      return [], None
+    mask = np.ones(len(self), dtype=bool)
+    if 'O' not in flags:
+      mask &= ~self.overlap
+    if 'T' in flags:
+      mask &= self.trackless
+    rows = np.flatnonzero(mask)
+    dims = list(columns) + ([min_column] if min_column else [])
+    index = rows[skyline(np.column_stack([self.columns[c][rows] for c in dims]))]
+    if not min_column or not len(index):
+      return scores(self.records, columns, index), None
+    # The min metric is a third dimension, the frontier at its minimum is then the 2D frontier for the category
+    minimum = self.columns[min_column][index]
+    min_score = scores(self.records, [min_column], index[minimum == minimum.min()][:1])[0][0]
+    return scores(self.records, columns, index[minimum == minimum.min()]), min_score
@@ -1,16 +1,25 @@
-import os, json, re
-import dropbox
+import time
+# Taken before anything else is imported, so that the startup profile includes the imports
+STARTED = time.perf_counter()
+import os, io, sys, json, hashlib
+import asyncio
 import discord
-from time import sleep
-from pprint import pformat
 from discord import app_commands
-from datetime import datetime,timedelta,timezone
+from datetime import datetime,timezone
 
-import numpy as np
-import matplotlib.ticker as mticker
-import matplotlib.pyplot as pl
-import requests
 import logging
+import logging.handlers
+
+import archive
+import backfill
+import daily
+import metrics
+from metrics import log
+import scheduler
+import store
+import submissions
+import tracker
+from daily import Pick, score_string
 
 
 # Assume client refers to a discord.Client subclass...
@@ -20,335 +29,283 @@ DISCORD_GUILD = os.environ['DISCORD_GUILD']
 DISCORD_CHANNEL = os.environ['DISCORD_CHANNEL']
 DISCORD_THREAD = os.environ['DISCORD_THREAD']
 DISCORD_LEADERBOARD_BOT = os.environ['DISCORD_LEADERBOARD_BOT']
-DROPBOX_APP_KEY = os.environ['DROPBOX_APP_KEY']
-DROPBOX_APP_SECRET = os.environ['DROPBOX_APP_SECRET']
-DROPBOX_ACCESS_TOKEN = os.environ['DROPBOX_ACCESS_TOKEN']
-DROPBOX_REFRESH_TOKEN = os.environ['DROPBOX_REFRESH_TOKEN']
+# The Dropbox secrets are read by store.dropbox_client, once the client is first needed
+
+# `python main.py --profile` prints how long each phase of startup took once the bot is ready, then exits
+PROFILE = '--profile' in sys.argv[1:]
+phases = []
+
+def phase(name):
+  """Marks the end of a startup phase, timed from the end of the previous one."""
+  phases.append((name, time.perf_counter()))
+
+def profile_report() -> str:
+  lines, last = [], STARTED
+  for name, end in phases:
+    lines.append(f'{name:<24}{end - last:8.3f}s')
+    last = end
+  lines.append(f'{"total":<24}{last - STARTED:8.3f}s')
+  return '\n'.join(lines)
+
+phase('imports')
 
 # Setup for the discord bot, declaring intented uses
 intents = discord.Intents(messages=True, message_content=True, members=True, guilds=True)
 client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
+# The hash of the command definitions last synced to Discord, so that restarts only sync when they changed
+COMMAND_HASH = 'commands.hash'
 
-dbx = dropbox.Dropbox(oauth2_access_token=DROPBOX_ACCESS_TOKEN,oauth2_refresh_token=DROPBOX_REFRESH_TOKEN,
-                      app_key=DROPBOX_APP_KEY,app_secret=DROPBOX_APP_SECRET)
-
-# TODO: Add logging functionality
-
-def normed(x):
-  """Convenience function to reduce a positive array to percentages."""
-  return x / np.sum(x)
-
-def pareto_compare(a, b) -> bool:
-  """Convenience function to return True if b is ever better in a pareto sense than A"""
-  # Probably can be simplified to a one-liner, but it's fine.
-  if a == b:
-    return False
-  return all(z[0] >= z[1] for z in zip(a, b))
+# Every daily the bot runs: the default one from the secrets above, plus any configured in DAILIES_FILE
+DAILIES_FILE = os.environ.get('DAILIES_FILE', 'dailies.json')
+daily.default.guild, daily.default.channel, daily.default.thread = int(DISCORD_GUILD), int(DISCORD_CHANNEL), int(DISCORD_THREAD)
+dailies = scheduler.load_dailies(DAILIES_FILE, daily.default)
+# Slash commands are registered in every guild with a daily
+GUILDS = [discord.Object(id=g) for g in sorted({c.guild for c in dailies})]
 
-def score_string(scores, category) -> str:
-  """Power one-liner to make a score string out of scores, looks like '100a/90b, 89a/80b', etc."""
-  return ', '.join(['/'.join([''.join(z) for z in zip(map(str, s), category.lower())]) for s in scores])
+# Picks and charts are kept locally and backed up to Dropbox in the background, the Dropbox client is built on ready
+# The default daily keeps its store and Dropbox folders, the others get their own under /dailies
+dbx = None
+db = store.Store('picks.db')
+daily.db = db
+for config in dailies:
+  if config is not daily.default:
+    config.db = store.Store(f'picks-{config.name}.db', f'/dailies/{config.name}')
+stores = [c.store() for c in dailies]
+sync_task = None
+track_task = None
+schedule_task = None
+# The thread each daily is posted in, by name, fetched on ready
+threads = {}
+# How often the running dailies' frontiers are refreshed, in seconds
+TRACK_INTERVAL = int(os.environ.get('TRACK_INTERVAL', 600))
 
-class Pick():
-  """
-  The default class used to generate, store, and load the pick for the daily pareto.
-  All attributes should be JSON-handleable.
-  """
-  def __init__(self, ordinal, reroll=False):
-    """
-    Load or generate a pick based on its ordinal, the number of days since 01-01-0001
-    End scores will be from start scores after the initial generation assuming submissions have been made.
-    """
-    self.day = ordinal
-    if reroll or not self.load():
-      self.start_scores = self.random()
-    self.end_scores = self.get_frontier()
-    self.save()
+# Leaderboard bot submissions, indexed as they arrive so that results posts can credit submitters, one index per daily
+submission_indexes = {c.name: submissions.SubmissionIndex('submissions.json' if c is daily.default else f'submissions-{c.name}.json',
+                                                           int(DISCORD_LEADERBOARD_BOT), hour=c.hour)
+                      for c in dailies}
 
-  def __repr__(self):
-    """Printing a pick object will provide the pprint formatted version of its attributes"""
-    return pformat(self.__dict__)
+# Timings of the bot's hot paths are logged to discord.log and served for Prometheus on METRICS_HOST:METRICS_PORT.
+# Only served locally by default, set METRICS_HOST to 0.0.0.0 for a scraper on another machine.
+METRICS_HOST = os.environ.get('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 8080))
+SEND_SECONDS = metrics.histogram('discord_send_seconds', 'Time to send a message to Discord, by kind.')
 
-  def load(self) -> bool:
-    """Tries to load the pick from Dropbox, if it fails, return False."""
-    try:
-      data = dbx.files_download(f"/picks/{self.day}.txt")[1]
-      data_json = json.loads(data.content)
-      for i in data_json:
-        self.__dict__[i] = data_json[i]
-      return True
-    except dropbox.exceptions.ApiError:
-      return False
+async def send(channel, kind, **kwargs):
+  """Sends a message to a channel, timing it under the given kind."""
+  with SEND_SECONDS.timer(kind=kind):
+    return await channel.send(**kwargs)
 
-  def save(self):
-    """Saves the pick to Dropbox, as a JSON"""
-    # Note that datetime objects are not JSON serializable so they should not be included as a class object
-    dbx.files_upload(bytes(json.dumps(self.__dict__,indent=4),'utf-8'),f"/picks/{self.day}.txt",
-                     mode=dropbox.files.WriteMode.overwrite)
+def daily_for(interaction):
+  """The daily a command was used for, the one posted where it was used or else the first of its guild."""
+  configs = [c for c in dailies if c.guild == interaction.guild_id]
+  return next((c for c in configs if c.thread == interaction.channel_id), configs[0])
 
-  def random(self,reload=False):
-    """
-    Generate a pick composed of puzzle and category based on weighted probabilities.
-    Also retrieves currently available scores related to the pick.
-    """
-    # Loads the puzzles from zlbb, or reloads them if desired.
-    if reload or not os.path.isfile('puzzle.json'):
-      puzzles = requests.get('https://zlbb.faendir.com/om/puzzles').json()
-      with open('puzzles.json', 'w') as file:
-        json.dump(puzzles, file)
-    else:
-      with open('puzzles.json', 'r') as file:
-        puzzles = json.load(file)
-    
-    # TODO: filter out puzzles like stab water
-    chapter_puzzles = tuple(filter(lambda x: 'CHAPTER' in x['group']['id'], puzzles))
-    journal_puzzles = tuple(filter(lambda x: 'JOURNAL' in x['group']['id'], puzzles))
-    tournament_puzzles = tuple(filter(lambda x: 'TOURNAMENT' in x['group']['id'], puzzles))
-    
-    # The stock puzzles are given more precedence than journal puzzles due to ease and familiarity
-    grouped_puzzles = np.array([chapter_puzzles, journal_puzzles, tournament_puzzles], dtype=object)
-    grouped_puzzles_weight = normed([3, 2, 1])
-    
-    # Height and Width are unavailable in production since all solutions will be identical (or cheated) there
-    # FUTURE: Account for manifold split
-    categories = ['G', 'C', 'A', 'I', 'H', 'W']
-    categories_weight = [[3, 3, 2, 3, 1, 1], [1, 1, 1, 1, 0, 0]]
-    catmap = [{'G':'cost', 'C':'cycles', 'A':'area', 'I':'instructions', 'H':'height', 'W':'width'},
-              {'G':'cost', 'R':'rate', 'A':'areaINF', 'I':'instructions', 'H':'heightINF', 'W':'widthINF'}]
-    
-    catlink = [{'G':'g', 'C':'c', 'A':'a', 'I':'i', 'H':'h', 'W':'w'},
-               {'G':'g', 'R':'r', 'A':'aI', 'I':'i', 'H':'hI', 'W':'wI'}]
-    
-    
-    rng = np.random.default_rng()
-    self.puzzle = rng.choice(rng.choice(grouped_puzzles, p=grouped_puzzles_weight))
-    scores = None
-    while not scores:
-      # If a bad category is rolled, scores will return None, so this process repeats until a good category is rolled.
-      # The "min_flag" should be unique from the category, so they are generated together.
-      # Each of the flags O, T, and min_flag, have a small chance of being added to the category thereafter.
-      probs = normed(categories_weight[self.puzzle['type'] == 'PRODUCTION'])
-      metrics = ''.join(rng.choice(categories, 3, False, p=probs))
-      self.category, self.min_flag = ''.join(sorted(metrics[:2],key=lambda x: categories.index(x))), metrics[2]
-      self.flags = ''.join(
-        (rng.choice(['', 'O'], p=[0.99,0.01]),
-         rng.choice(['', 'T'], p=[0.9, 0.1]),
-         rng.choice(['', self.min_flag], p=[0.85, 0.15])))
-      self.manifold = rng.choice(['V', 'INF'], p=[0.7,0.3])
-      mani_bool = self.manifold == 'INF'
-      
-      if mani_bool: self.category = self.category.replace('C','R')
-      if mani_bool: self.min_flag = self.min_flag.replace('C','R')
-      if mani_bool: self.flags = self.flags.replace('C','R')
-      self.cat_long = [catmap[mani_bool][i] for i in self.category]
-      self.min_long = catmap[mani_bool][self.min_flag]
-      self.cat_link = [catlink[mani_bool][i] for i in self.category]
-      self.min_link = catlink[mani_bool][self.min_flag]
+@discord.app_commands.checks.has_role('reroller')
+@tree.command(name = "daily_reroll", description = "Reroll the daily.", guilds=GUILDS)
+async def reroll(interaction):
+  """Discord command to reroll the daily, also deleting the previous announcement of it."""
+  config = daily_for(interaction)
+  A = await client.fetch_channel(config.thread)
+  # The daily running now, which is still yesterday's before the daily's hour
+  ordinal = submissions.daily_of(datetime.now(timezone.utc), config.hour)
+  await delete_announcement(A, config, ordinal)
+  pick = await Pick.create(ordinal,reroll=True,config=config)
+  png = await pick.make_chart_async()
+  message = await send(A, 'announcement', embed=pick.get_discord_announcement(),
+                       file=discord.File(io.BytesIO(png),filename='today.png'))
+  config.store().mark_posted(ordinal, 'announcement', message.id)
 
-      print(pformat(self.__dict__))
-      scores = self.get_frontier()
-      print(scores)
-    return scores
+async def delete_announcement(thread, config, ordinal):
+  """Deletes the announcement of a day, found by the message ID stored when it was sent."""
+  message_id = config.store().message(ordinal, 'announcement')
+  if message_id is None:
+    # Announced before message IDs were kept, it is the latest announcement embed the bot sent.
+    # Frontier updates go in the same thread, so the bot's latest message isn't necessarily it.
+    async for message in thread.history(limit=200):
+      if message.author == client.user and message.embeds and message.embeds[0].title.startswith('Daily Pareto for'):
+        await message.delete()
+        break
+    return
+  try:
+    await thread.get_partial_message(message_id).delete()
+  except discord.NotFound:
+    pass
 
-  def get_frontier(self):
-    """
-    Gets the entire pareto frontier from zlbb, 
-    and filters it down to just the category the pick is working with.
-    """
-    url = f'https://zlbb.faendir.com/om/puzzle/{self.puzzle["id"]}/records?includeFrontier=true'
-    frontier = requests.get(url).json()
-    frontier = tuple(filter(lambda x: x['score'][self.cat_long[0]] != None, frontier))
-    frontier = tuple(filter(lambda x: x['score'][self.cat_long[1]] != None, frontier))
-    if 'O' not in self.flags:
-      frontier = tuple(filter(lambda x: x['score']['overlap'] == False, frontier))
-    if 'T' in self.flags:
-      frontier = tuple(filter(lambda x: x['score']['trackless'] == True, frontier))
-    if self.min_flag in self.flags:
-      self.min_score = min(np.inf if i['score'][self.min_long] in ['∞','Infinity'] 
-                           else i['score'][self.min_long] for i in frontier)
-      frontier = tuple(filter(lambda x: x['score'][self.min_long] == self.min_score,frontier))
+@discord.app_commands.checks.has_role('reroller')
+@tree.command(name = "daily_backfill", description = "Rebuild past results charts, dates as YYYY-MM-DD.", guilds=GUILDS)
+async def backfill_command(interaction, start: str, end: str):
+  """Discord command to rebuild the end scores and charts of a daily's past days over a date range."""
+  config = daily_for(interaction)
+  # Checked before deferring, once deferred a bad date would leave the command thinking forever
+  try:
+    start, end = (datetime.strptime(d, '%Y-%m-%d').toordinal() for d in (start, end))
+  except ValueError:
+    await interaction.response.send_message('Dates have to be given as YYYY-MM-DD.', ephemeral=True)
+    return
+  if start > end:
+    await interaction.response.send_message('The start date has to be on or before the end date.', ephemeral=True)
+    return
+  await interaction.response.defer()
+  await interaction.followup.send(backfill.report(*await backfill.backfill(start, end, config=config)))
+  
+def command_definitions(guild) -> list:
+  """The command definitions registered for a guild, as they would be sent to Discord."""
+  commands = tree.get_commands(guild=guild)
+  try:
+    data = [c.to_dict(tree) for c in commands]
+  except TypeError:
+    # Before discord.py 2.4, to_dict took no arguments
+    data = [c.to_dict() for c in commands]
+  return sorted(data, key=lambda c: c['name'])
 
-    scores = [tuple(np.inf if f['score'][c] in ['∞','Infinity']
-                    else f['score'][c] for c in self.cat_long) for f in frontier]
-    if (scores is None):
-      # If a score is ever None, something's gone wrong, return None and reroll.
-      return None
+def command_hash() -> str:
+  """Hash of the command definitions of every guild."""
+  data = json.dumps([[g.id, command_definitions(g)] for g in GUILDS], sort_keys=True, default=str)
+  return hashlib.sha256(data.encode('utf-8')).hexdigest()
 
-    scores = sorted(set(scores))
-    scores = [a for a in scores if not any(pareto_compare(a, b) for b in scores)]
-    return scores
+async def sync_commands():
+  """Syncs the command tree to Discord, unless the definitions are the same as the last time they were synced."""
+  digest = command_hash()
+  try:
+    with open(COMMAND_HASH, 'r') as file:
+      if file.read().strip() == digest:
+        return False
+  except FileNotFoundError:
+    pass
+  for guild in GUILDS:
+    await tree.sync(guild=guild)
+  with open(COMMAND_HASH, 'w') as file:
+    file.write(digest)
+  return True
 
-  def get_discord_announcement(self,auto=True):
-    """Generates a Discord embed for the bot to post indicating the category for the day."""
-    date = datetime.fromordinal(self.day)
-    filename = self.make_chart('today')
-    scores = score_string(self.start_scores, self.category)
-    link = self.get_leaderboard_link()
-    if auto:
-      embed = discord.Embed(color=discord.Color.dark_gold(),
-                            title=f"Daily Pareto for {date:%B %d, %Y}",
-                            description=f"{self.flags}({self.category})@{self.manifold} for {self.puzzle['displayName']}: [zlbb 🔗]({link})\n```{scores}```",
-                            timestamp=date + timedelta(hours=12))
-      embed.set_image(url=f'attachment://{filename}')
-      return embed
-    else:
-      return f"```Daily Pareto for {date:%B %d, %Y}:\n{self.flags}({self.category})@{self.manifold} for {self.puzzle['displayName']}\n{scores}```\n<{link}>\n"
+@client.event
+async def on_ready():
+  """Discord ready event, starts the background tasks the first time and resumes the daily loop after a reconnect."""
+  phase('connect')
+  await sync_commands()
+  phase('command sync')
+  for config in dailies:
+    threads[config.name] = await client.fetch_channel(config.thread)
+    await threads[config.name].join()
+  phase('channels')
+  # Submissions posted while the bot was away are indexed before anything is announced
+  for config in dailies:
+    for channel in (threads[config.name], await client.fetch_channel(config.channel)):
+      await submission_indexes[config.name].catch_up(channel)
+  phase('submission catch-up')
+  global dbx, sync_task
+  if sync_task is None:
+    loop = asyncio.get_running_loop()
+    dbx = daily.dbx = await loop.run_in_executor(None, store.dropbox_client)
+    for local in stores:
+      await loop.run_in_executor(None, archive.restore, dbx, local)
+      await loop.run_in_executor(None, local.reconcile, dbx)
+    sync_task = asyncio.create_task(sync_store())
+  elif sync_task.done():
+    # The loop only stops on something it can't handle, a reconnect is as good a time as any to start it again
+    log.error('Store sync stopped, restarting it: %r', sync_task.exception())
+    sync_task = asyncio.create_task(sync_store())
+  phase('store restore')
 
-  
-  def get_results_post(self,submitters,auto=True):
-    """Generates a Discord embed for the bot to post indicating the results for yesterday."""
-    date = datetime.fromordinal(self.day)
-    filename = self.make_chart('yesterday')
-#    description = f"Submissions by {', '.join(submitters)}" if submitters else "No submissions"
-    description = None
-    if auto:
-      embed = discord.Embed(color=discord.Color.gold(),
-                            title=f"Daily Pareto Results for {date:%B %d, %Y}", 
-                            description=description)
-      embed.set_image(url=f'attachment://{filename}')
-      return embed
-  
-  def get_leaderboard_link(self):
-    """Generates a URL link to zlbb based on puzzle, category, and set flags."""
-    link = f'https://zlbb.faendir.com/puzzles/{self.puzzle["id"]}/visualizer?visualizerFilter-{self.puzzle["id"]}.showOnlyFrontier=true&visualizerConfig.mode=2D&visualizerConfig.x={self.cat_link[0]}&visualizerConfig.y={self.cat_link[1]}'
-    if 'O' not in self.flags:
-      link += f'&visualizerFilter-{self.puzzle["id"]}.modifiers.overlap=false'
-    if 'T' in self.flags:
-      link += f'&visualizerFilter-{self.puzzle["id"]}.modifiers.trackless=true'
-    if self.min_flag in self.flags:
-      link += f'&visualizerFilter-{self.puzzle["id"]}.range.{self.min_link}.max={self.min_score}'
-    return link
+  if PROFILE:
+    print(profile_report())
+    await client.close()
+    return
 
-  def make_chart(self, local_name='yesterday'):
-    """
-    Generates a plot showing the results of the daily, comparing current scores to starting scores.
-    Returns the local file name of the chart (with file extension).
-    """
-    date = datetime.fromordinal(self.day)
-    pl.clf()
-    pl.figure(figsize=(8, 6), layout='tight')
-    pl.rc('font', size=18)
-    pl.style.use('dark_background')
-    pl.title(f"{self.flags}({self.category})@{self.manifold} for {self.puzzle['displayName']} {date:%Y-%m-%d} ")
-    pl.xlabel(self.category[0])
-    pl.ylabel(self.category[1])
-    pl.grid(True, which='both', alpha=.25)
-    pl.loglog()
-    ax = pl.gca()
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
+  global track_task
+  if track_task is not None and track_task.done():
+    log.error('Frontier tracking stopped, restarting it: %r', track_task.exception())
+  if track_task is None or track_task.done():
+    async def frontier_moved(pick, added, dominated):
+      if added:
+        await send(threads[pick.config.name], 'frontier', content=f"Frontier moved for {pick.puzzle['displayName']}: ```{score_string(added, pick.category)}```")
+    track_task = asyncio.create_task(tracker.poll(TRACK_INTERVAL, frontier_moved, dailies))
 
-    # Adds additional gridlines, though this might sometimes cause overlap in tick labels
-    ax.xaxis.set_major_formatter(mticker.ScalarFormatter())
-    ax.xaxis.set_minor_formatter(mticker.ScalarFormatter())
-    ax.yaxis.set_major_formatter(mticker.ScalarFormatter())
-    ax.yaxis.set_minor_formatter(mticker.ScalarFormatter())
-  
-    # Infinities are not handled presently, perhaps in the future.
-    start = set(tuple(s) for s in self.start_scores if np.inf not in s)
-    end = set(tuple(s) for s in self.end_scores if np.inf not in s)
+  # A reconnect fires on_ready again, the scheduler already running carries on rather than being started twice
+  global schedule_task
+  if schedule_task is None or schedule_task.done():
+    schedule_task = asyncio.create_task(scheduler.Scheduler(dailies, announce).run())
+  log.info('Ready!')
 
-    # TODO: if minflag is set, handle case where min is improved
-    dead = start.difference(end)
-    keep = start.intersection(end)
-    new = end.difference(start)
-    if len(dead): pl.plot(*zip(*dead), 'ro', ms=8, fillstyle='none')
-    if len(keep): pl.plot(*zip(*keep), 'ro', ms=8)
-    if len(new): pl.plot(*zip(*new), 'go', ms=8)
-  
-    pl.savefig(f'{local_name}.png')
-    if local_name == 'yesterday':
-      with open(f'{local_name}.png','rb') as f:
-        dbx.files_upload(f.read(),f"/charts/{self.day}.png",mode=dropbox.files.WriteMode.overwrite)
-    return f'{local_name}.png'
+async def announce(config, ordinal):
+  """
+  Posts a daily's results for the day before ordinal and its pick for ordinal, called by the scheduler when due.
+  Each post is marked as sent as soon as it is, so a retry after a failure picks up where this left off.
+  A daily that has never posted anything starts with its first announcement, there are no results before it.
+  """
+  thread = threads[config.name]
+  db = config.store()
+  last = db.last_posted()
+  started = last is not None or db.posted(ordinal - 1, 'announcement')
+  results = started and (last is None or last < ordinal - 1)
+  # Both picks are made and both charts rendered at once, the checks only decide which of them are still sent
+  days = [ordinal - 1, ordinal] if results else [ordinal]
+  picks = await asyncio.gather(*(Pick.create(day, config=config) for day in days))
+  pngs = await asyncio.gather(*(pick.make_chart_async() for pick in picks))
+  if results:
+    pick_old, png_old = picks[0], pngs[0]
+    submitters = submission_indexes[config.name].submitters(pick_old.day, pick_old.puzzle['displayName'])
+    log.info('Submitters to %s on %s: %s', config.name, ordinal-1, ', '.join(sorted(submitters)) or 'none')
+    message = await send(thread, 'results', embed=pick_old.get_results_post(submitters),
+                         file=discord.File(io.BytesIO(png_old),filename='yesterday.png'))
+    # Yesterday's chart is stored locally and synced to Dropbox later
+    pick_old.save_chart(png_old)
+    db.mark_posted(ordinal-1, 'results', message.id)
+  if not db.posted(ordinal, 'announcement'):
+    pick, png = picks[-1], pngs[-1]
+    message = await send(thread, 'announcement', embed=pick.get_discord_announcement(),
+                         file=discord.File(io.BytesIO(png),filename='today.png'))
+    db.mark_posted(ordinal, 'announcement', message.id)
 
-@discord.app_commands.checks.has_role('reroller')
-@tree.command(name = "daily_reroll", description = "Reroll the daily.", guild=discord.Object(id=DISCORD_GUILD))
-async def reroll(interaction):
-  """Discord command to reroll the daily, also deleting the previous mention of it."""
-  A = await client.fetch_channel(DISCORD_THREAD)
-  async for message in A.history(limit=200):
-      if message.author == client.user:
-          await message.delete()
-          break
-  today = datetime.now(timezone.utc)
-  ordinal = today.toordinal()
-  pick = Pick(ordinal,reroll=True)
-  pick.make_chart('today')
-  with open('today.png','rb') as f:
-    await A.send(embed=pick.get_discord_announcement(),
-                 file=discord.File(f,filename='today.png'))
-  
 @client.event
-async def on_ready():
-  """Discord ready event, starts/resumes the loop to post the daily."""
-  await tree.sync(guild=discord.Object(id=DISCORD_GUILD))
-  thread = await client.fetch_channel(DISCORD_THREAD)
-#  om = await client.fetch_channel(DISCORD_CHANNEL)
-#  leaderboard_bot = await client.fetch_user(DISCORD_LEADERBOARD_BOT)
-  await thread.join()
-  print('Ready!')
+async def on_message(message):
+  """Discord message event, indexes leaderboard bot submissions as they are posted."""
+  for config in dailies:
+    if message.channel.id in (config.thread, config.channel):
+      submission_indexes[config.name].add(message)
 
-  # Series of conditions to determine if a message is by the leaderboard bot and is a submission message
-  # Pretty fragile as a result, but works for now.
-#  conditions = lambda x: ((x.author == leaderboard_bot) and (len(x.embeds) > 0) and \
-#  (x.embeds[0].title != None) and ('New Submission' in x.embeds[0].title) and \
-#  (re.search(r'\*(.*)\*',x.embeds[0].title).group(1) == pick.puzzle['displayName']))
+async def sync_store():
+  """Write-behind loop backing up the local pick stores to Dropbox in batches."""
+  loop = asyncio.get_running_loop()
   while True:
-    today = datetime.now(timezone.utc)
-    ordinal = today.toordinal()
-    last_upload = int([i.name for i in dbx.files_list_folder('/charts').entries][-1].split('.')[0])
-    # The daily is announced at noon UTC
-    announce_time = datetime.fromordinal(ordinal+(last_upload+1 == ordinal)) + timedelta(hours=12)
-    print(announce_time)
-    await discord.utils.sleep_until(announce_time)
-    # The day has to be recalculated in case of bot reconnections and such
-    today = datetime.now(timezone.utc)
-    ordinal = today.toordinal()
-    pick_old = Pick(ordinal-1)
-    pick = Pick(ordinal)
-    submitters = set()
-    # Checks the two channels for any submssions (is this an API expensive operation?)
-    # Would be ideal to just check messages from the leaderboard bot but this doesn't seem to work
-#    async for message in thread.history(before=announce_time,limit=1000):
-#      if conditions(message):
-#        print(message.author,message.embeds[0].title)
-#        submitters.add(re.search(r'by (.*) was', message.embeds[0].description).group(1))
-  
-#    async for message in om.history(before=announce_time,limit=200):
-#      if conditions(message):
-#        print(message.author,message.embeds[0].title)
-#        submitters.add(re.search(r'by (.*) was', message.embeds[0].description).group(1))
-    print(submitters)
-    pick_old.make_chart('yesterday')
-    with open('yesterday.png','rb') as f:
-      await thread.send(embed=pick_old.get_results_post(submitters), 
-                        file=discord.File(f,filename='yesterday.png'))
-    pick.make_chart('today')
-    with open('today.png','rb') as f:
-      await thread.send(embed=pick.get_discord_announcement(),
-                        file=discord.File(f,filename='today.png'))
-    sleep(60)
+    try:
+      for local in stores:
+        while await loop.run_in_executor(None, local.sync, dbx):
+          pass
+    except Exception:
+      # Network blips surface as requests errors from the SDK rather than Dropbox ones, and there is SQLite too,
+      # whatever it was the rows stay dirty for the next pass
+      log.exception('Store sync failed')
+    await asyncio.sleep(60)
+
+phase('setup')
 
 # This line must be run after all the Discord commands are defined.
 auto = True
-if auto:
-  sleep(5)
-  handler = logging.FileHandler(filename='discord.log', encoding='utf-8', mode='w')
-  client.run(DISCORD_BOT_TOKEN, log_handler = handler)
+if __name__ == '__main__' and auto:
+  # The log is kept across restarts now that it carries the timings, rotated so it can't grow without bound
+  handler = logging.handlers.RotatingFileHandler(filename='discord.log', encoding='utf-8', maxBytes=5*1024*1024, backupCount=5)
+  if not PROFILE:
+    metrics.serve(METRICS_PORT, METRICS_HOST)
+  client.run(DISCORD_BOT_TOKEN, log_handler = handler, root_logger = True)
 
-else:
+elif __name__ == '__main__':
+  dbx = daily.dbx = store.dropbox_client()
   ordinal = datetime.today().toordinal()
   pick_old = Pick(ordinal-1)
   pick = Pick(ordinal,reroll=bool(input('Reroll? ')))
   print(pick)
   print(pick.get_discord_announcement(auto=False))
-  pick_old.make_chart()
+  png = pick_old.make_chart()
+  pick_old.save_chart(png)
+  with open('yesterday.png','wb') as f:
+    f.write(png)
+  db.sync(dbx)
   print()
-    
+
 # lines to generate access token and refresh token, need to make it more formal later.
-#A = dropbox.oauth.DropboxOAuth2FlowNoRedirect(DROPBOX_APP_KEY,DROPBOX_APP_SECRET,token_access_type='offline')
+#A = dropbox.oauth.DropboxOAuth2FlowNoRedirect(os.environ['DROPBOX_APP_KEY'],os.environ['DROPBOX_APP_SECRET'],token_access_type='offline')
 #print(A.start())
 #auth_code = input()
 #B = A.finish(auth_code)
@@ -0,0 +1,109 @@
+import time, bisect, logging, threading, contextlib
+
+log = logging.getLogger('daily_pareto')
+
+# Default histogram buckets, in seconds
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+lock = threading.Lock()
+registry = {}
+
+def format_labels(labels) -> str:
+  if not labels:
+    return ''
+  return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+class Counter():
+  """A Prometheus counter, one value per label set."""
+  kind = 'counter'
+
+  def __init__(self, name, help):
+    self.name = name
+    self.help = help
+    self.values = {}
+
+  def inc(self, amount=1, **labels):
+    key = tuple(sorted(labels.items()))
+    with lock:
+      self.values[key] = self.values.get(key, 0) + amount
+
+  def samples(self):
+    for key, value in self.values.items():
+      yield f'{self.name}{format_labels(key)} {value}'
+
+class Histogram():
+  """A Prometheus histogram, one set of cumulative buckets per label set."""
+  kind = 'histogram'
+
+  def __init__(self, name, help, buckets=BUCKETS):
+    self.name = name
+    self.help = help
+    self.buckets = tuple(buckets)
+    self.values = {}
+
+  def observe(self, value, **labels):
+    key = tuple(sorted(labels.items()))
+    with lock:
+      counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0))
+      counts[bisect.bisect_left(self.buckets, value)] += 1
+      self.values[key] = (counts, total + value)
+
+  @contextlib.contextmanager
+  def timer(self, **labels):
+    """
+    Times the block into the histogram, and logs it as a structured line.
+    Works across awaits too, so it can wrap network calls in coroutines.
+    """
+    begin = time.perf_counter()
+    try:
+      yield
+    finally:
+      elapsed = time.perf_counter() - begin
+      self.observe(elapsed, **labels)
+      log.info('%s %s seconds=%.4f', self.name, ' '.join(f'{k}={v}' for k, v in labels.items()), elapsed)
+
+  def samples(self):
+    for key, (counts, total) in self.values.items():
+      cumulative = 0
+      for bound, count in zip(self.buckets + ('+Inf',), counts):
+        cumulative += count
+        yield f'{self.name}_bucket{format_labels(key + (("le", bound),))} {cumulative}'
+      yield f'{self.name}_sum{format_labels(key)} {total}'
+      yield f'{self.name}_count{format_labels(key)} {cumulative}'
+
+def counter(name, help) -> Counter:
+  """Registers a counter, or returns the one already registered under the name."""
+  with lock:
+    if name not in registry:
+      registry[name] = Counter(name, help)
+    return registry[name]
+
+def histogram(name, help, buckets=BUCKETS) -> Histogram:
+  """Registers a histogram, or returns the one already registered under the name."""
+  with lock:
+    if name not in registry:
+      registry[name] = Histogram(name, help, buckets)
+    return registry[name]
+
+def render() -> str:
+  """All metrics in the Prometheus text exposition format."""
+  lines = []
+  with lock:
+    for metric in registry.values():
+      lines.append(f'# HELP {metric.name} {metric.help}')
+      lines.append(f'# TYPE {metric.name} {metric.kind}')
+      lines.extend(metric.samples())
+  return '\n'.join(lines) + '\n'
+
+def serve(port=8080, host='127.0.0.1'):
+  """Serves /metrics from a Flask app in a daemon thread, only locally unless another host is given."""
+  from flask import Flask, Response
+  app = Flask('metrics')
+
+  @app.route('/metrics')
+  def metrics():
+    return Response(render(), mimetype='text/plain; version=0.0.4')
+
+  thread = threading.Thread(target=app.run, kwargs={'host': host, 'port': port, 'use_reloader': False},
+                            daemon=True, name='metrics')
+  thread.start()
+  return thread
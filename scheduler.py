@@ -0,0 +1,116 @@
+import json, heapq, asyncio, itertools
+from datetime import datetime, timezone, timedelta
+
+import daily
+from metrics import log
+
+# How long to wait before trying an announcement again after it failed, in seconds, and how many times to try
+RETRY = 300
+MAX_ATTEMPTS = 5
+
+def load_dailies(path, default=None) -> list:
+  """
+  Reads the daily configs from a JSON list in path, see daily.Config.from_dict for the entries.
+  The default daily goes first, the file may also override it with an entry named 'default'.
+  """
+  dailies = {} if default is None else {default.name: default}
+  try:
+    with open(path, 'r') as file:
+      data = json.load(file)
+  except FileNotFoundError:
+    data = []
+  for entry in data:
+    config = daily.Config.from_dict(entry)
+    if config.name in dailies:
+      # Updated in place, since picks made without a config fall back to the default daily's object
+      vars(dailies[config.name]).update(vars(config))
+    else:
+      dailies[config.name] = config
+  return list(dailies.values())
+
+class Scheduler():
+  """
+  Priority queue of the next announcement of every daily, earliest first.
+  Announcements that come due together are dispatched concurrently, at most `concurrency` at a time,
+  and each daily is queued again for its next announcement once its current one is done.
+  A failed announcement is retried every RETRY seconds, up to MAX_ATTEMPTS times before moving on to the next day.
+  """
+  def __init__(self, dailies, dispatch, concurrency=4):
+    self.dailies = dailies
+    self.dispatch = dispatch
+    self.concurrency = concurrency
+    self.queue = []
+    self.counter = itertools.count()
+    # Failed attempts at each daily's current announcement, by name
+    self.failures = {}
+    # Set whenever something is queued, so that the loop never sleeps past a retry
+    self.queued = None
+
+  def schedule(self, config, due=None, ordinal=None):
+    """
+    Queues a daily's next announcement, or a retry at the given time.
+    The ordinal of the day being announced is taken from when it is due, unless given, as it is for retries.
+    """
+    if due is None:
+      due = config.next_announcement(datetime.now(timezone.utc))
+    if ordinal is None:
+      ordinal = (due - timedelta(hours=config.hour)).toordinal()
+    # The counter breaks ties, configs themselves aren't comparable
+    heapq.heappush(self.queue, (due, next(self.counter), config, ordinal))
+    if self.queued is not None:
+      self.queued.set()
+
+  def due(self, now) -> list:
+    """Pops every announcement due by now, as (due, config, ordinal)."""
+    ready = []
+    while self.queue and self.queue[0][0] <= now:
+      due, _, config, ordinal = heapq.heappop(self.queue)
+      ready.append((due, config, ordinal))
+    return ready
+
+  async def run(self):
+    """
+    Runs the dailies forever, awaiting dispatch(config, ordinal) for each announcement.
+    The ordinal is that of the day being announced, taken from when it was due rather than when it ran,
+    and a retry keeps it, so the next day is still announced at the daily's hour however late the retry went through.
+    """
+    semaphore = asyncio.Semaphore(self.concurrency)
+    self.queued = asyncio.Event()
+    running = set()
+
+    async def announce(due, config, ordinal):
+      # The slot of the day after, at the daily's hour
+      following = datetime.fromordinal(ordinal + 1).replace(tzinfo=timezone.utc) + timedelta(hours=config.hour)
+      async with semaphore:
+        try:
+          await self.dispatch(config, ordinal)
+        except Exception:
+          log.exception('Announcing %s failed', config.name)
+          self.failures[config.name] = self.failures.get(config.name, 0) + 1
+          if self.failures[config.name] < MAX_ATTEMPTS:
+            self.schedule(config, datetime.now(timezone.utc) + timedelta(seconds=RETRY), ordinal)
+            return
+          log.error('Giving up on the announcement of %s due %s', config.name, due)
+          self.failures.pop(config.name)
+          self.schedule(config, following)
+          return
+        self.failures.pop(config.name, None)
+      # Posting the results is what moves a daily on, but it is never announced twice for the same day regardless
+      self.schedule(config, max(config.next_announcement(datetime.now(timezone.utc)), following))
+
+    for config in self.dailies:
+      self.schedule(config)
+    while True:
+      now = datetime.now(timezone.utc)
+      for due, config, ordinal in self.due(now):
+        log.info('Announcing %s due %s', config.name, due)
+        task = asyncio.create_task(announce(due, config, ordinal))
+        running.add(task)
+        task.add_done_callback(running.discard)
+      # Dailies being announced are off the queue until they are done, which wakes the loop up
+      wait = (self.queue[0][0] - now).total_seconds() if self.queue else 60
+      self.queued.clear()
+      try:
+        await asyncio.wait_for(self.queued.wait(), min(max(wait, 0), 60))
+      except asyncio.TimeoutError:
+        pass
@@ -0,0 +1,223 @@
+import os, json, sqlite3, threading
+
+import metrics
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS picks (
+  day INTEGER PRIMARY KEY,
+  puzzle TEXT,
+  category TEXT,
+  data TEXT NOT NULL,
+  dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS picks_puzzle ON picks (puzzle);
+CREATE INDEX IF NOT EXISTS picks_category ON picks (category);
+CREATE INDEX IF NOT EXISTS picks_dirty ON picks (dirty);
+CREATE TABLE IF NOT EXISTS charts (
+  day INTEGER PRIMARY KEY,
+  png BLOB,
+  dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS charts_dirty ON charts (dirty);
+CREATE TABLE IF NOT EXISTS deltas (
+  day INTEGER NOT NULL,
+  time REAL NOT NULL,
+  added TEXT NOT NULL,
+  dominated TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deltas_day ON deltas (day, time);
+CREATE TABLE IF NOT EXISTS posts (
+  day INTEGER NOT NULL,
+  kind TEXT NOT NULL,
+  message INTEGER,
+  PRIMARY KEY (day, kind)
+);
+CREATE TABLE IF NOT EXISTS bundles (
+  name TEXT PRIMARY KEY,
+  hash TEXT NOT NULL
+);
+'''
+
+DROPBOX_SECONDS = metrics.histogram('dropbox_seconds', 'Time spent on Dropbox calls, by operation.')
+
+def dropbox_client():
+  """Builds the Dropbox client from the secrets in the environment."""
+  import dropbox
+  return dropbox.Dropbox(oauth2_access_token=os.environ['DROPBOX_ACCESS_TOKEN'],
+                         oauth2_refresh_token=os.environ['DROPBOX_REFRESH_TOKEN'],
+                         app_key=os.environ['DROPBOX_APP_KEY'], app_secret=os.environ['DROPBOX_APP_SECRET'])
+
+def list_entries(dbx, path) -> list:
+  """Lists every entry of a Dropbox folder with its metadata, following pagination."""
+  # The SDK is only imported once Dropbox is actually used, it is slow to import and most runs never need it
+  import dropbox
+  try:
+    with DROPBOX_SECONDS.timer(op='list'):
+      result = dbx.files_list_folder(path)
+  except dropbox.exceptions.ApiError:
+    return []
+  entries = list(result.entries)
+  while result.has_more:
+    with DROPBOX_SECONDS.timer(op='list'):
+      result = dbx.files_list_folder_continue(result.cursor)
+    entries += result.entries
+  return entries
+
+def list_folder(dbx, path) -> list:
+  """Lists every entry name of a Dropbox folder, following pagination."""
+  return [e.name for e in list_entries(dbx, path)]
+
+class Store():
+  """
+  Local SQLite store of picks and results charts, keyed by ordinal, with Dropbox as a write-behind backup.
+  Writes only mark rows dirty, sync() later pushes them to Dropbox in batches.
+  The connection is shared between the event loop and worker threads, so every access holds the lock.
+  Dropbox paths are under prefix, empty for the default daily so that its files stay where they always were.
+  """
+  def __init__(self, path='picks.db', prefix=''):
+    self.prefix = prefix
+    self.lock = threading.Lock()
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    with self.lock, self.db:
+      self.db.executescript(SCHEMA)
+      # Posts recorded before their message IDs were kept
+      if 'message' not in [r[1] for r in self.db.execute('PRAGMA table_info(posts)')]:
+        self.db.execute('ALTER TABLE posts ADD COLUMN message INTEGER')
+
+  def get(self, day):
+    """Returns a pick's attributes by ordinal, or None if it isn't stored."""
+    with self.lock:
+      row = self.db.execute('SELECT data FROM picks WHERE day = ?', (day,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+  def put(self, day, pick, dirty=True) -> bool:
+    """Stores a pick's attributes, returning False without writing anything if they haven't changed."""
+    # Note that datetime objects are not JSON serializable so they should not be included as a class object
+    data = json.dumps(pick, indent=4)
+    with self.lock, self.db:
+      row = self.db.execute('SELECT data FROM picks WHERE day = ?', (day,)).fetchone()
+      if row and row[0] == data:
+        return False
+      self.db.execute('INSERT OR REPLACE INTO picks (day, puzzle, category, data, dirty) VALUES (?, ?, ?, ?, ?)',
+                      (day, pick.get('puzzle', {}).get('id'), pick.get('category'), data, int(dirty)))
+    return True
+
+  def put_chart(self, day, png, dirty=True):
+    """Stores a results chart, which also marks the day's results as posted."""
+    with self.lock, self.db:
+      self.db.execute('INSERT OR REPLACE INTO charts (day, png, dirty) VALUES (?, ?, ?)', (day, png, int(dirty)))
+
+  def add_delta(self, day, time, added, dominated):
+    """Records a change to a day's frontier, the points added and the points they dominated."""
+    with self.lock, self.db:
+      self.db.execute('INSERT INTO deltas (day, time, added, dominated) VALUES (?, ?, ?, ?)',
+                      (day, time, json.dumps(added), json.dumps(dominated)))
+
+  def deltas(self, day) -> list:
+    """A day's frontier changes in order, as (time, added, dominated) with points as tuples."""
+    with self.lock:
+      rows = self.db.execute('SELECT time, added, dominated FROM deltas WHERE day = ? ORDER BY time', (day,)).fetchall()
+    return [(t, [tuple(p) for p in json.loads(a)], [tuple(p) for p in json.loads(d)]) for t, a, d in rows]
+
+  def clear_deltas(self, day):
+    """Forgets a day's frontier changes, for when its pick is rerolled."""
+    with self.lock, self.db:
+      self.db.execute('DELETE FROM deltas WHERE day = ?', (day,))
+
+  def last_posted(self):
+    """The ordinal of the latest day whose results have been posted, or None."""
+    with self.lock:
+      return self.db.execute('SELECT MAX(day) FROM charts').fetchone()[0]
+
+  def mark_posted(self, day, kind, message=None):
+    """
+    Records that a day's 'results' or 'announcement' post went out, so that a retry doesn't send it again.
+    The ID of the Discord message is kept, so a reroll can replace the announcement; posting again replaces it.
+    """
+    with self.lock, self.db:
+      self.db.execute('INSERT OR REPLACE INTO posts (day, kind, message) VALUES (?, ?, ?)', (day, kind, message))
+
+  def posted(self, day, kind) -> bool:
+    with self.lock:
+      return self.db.execute('SELECT 1 FROM posts WHERE day = ? AND kind = ?', (day, kind)).fetchone() is not None
+
+  def message(self, day, kind):
+    """The ID of the Discord message a day's post went out as, or None if it isn't known."""
+    with self.lock:
+      row = self.db.execute('SELECT message FROM posts WHERE day = ? AND kind = ?', (day, kind)).fetchone()
+    return row[0] if row else None
+
+  def days_for_puzzle(self, puzzle_id) -> list:
+    """The ordinals a puzzle was picked on, looked up through the puzzle index."""
+    with self.lock:
+      return [r[0] for r in self.db.execute('SELECT day FROM picks WHERE puzzle = ? ORDER BY day', (puzzle_id,))]
+
+  def days_for_category(self, category) -> list:
+    """The ordinals a category was picked on, looked up through the category index."""
+    with self.lock:
+      return [r[0] for r in self.db.execute('SELECT day FROM picks WHERE category = ? ORDER BY day', (category,))]
+
+  def sync(self, dbx, batch=50) -> int:
+    """
+    Uploads up to `batch` dirty picks and charts to Dropbox, returning how many were uploaded.
+    Several saves of the same day between syncs only cost one upload.
+    A row is only marked clean if it wasn't changed again while it was being uploaded.
+    """
+    import dropbox
+    with self.lock:
+      picks = self.db.execute('SELECT day, data FROM picks WHERE dirty = 1 LIMIT ?', (batch,)).fetchall()
+      charts = self.db.execute('SELECT day, png FROM charts WHERE dirty = 1 LIMIT ?', (batch,)).fetchall()
+    for day, data in picks:
+      with DROPBOX_SECONDS.timer(op='upload'):
+        dbx.files_upload(bytes(data, 'utf-8'), f"{self.prefix}/picks/{day}.txt", mode=dropbox.files.WriteMode.overwrite)
+      with self.lock, self.db:
+        self.db.execute('UPDATE picks SET dirty = 0 WHERE day = ? AND data = ?', (day, data))
+    for day, png in charts:
+      with DROPBOX_SECONDS.timer(op='upload'):
+        dbx.files_upload(png, f"{self.prefix}/charts/{day}.png", mode=dropbox.files.WriteMode.overwrite)
+      with self.lock, self.db:
+        self.db.execute('UPDATE charts SET dirty = 0 WHERE day = ? AND png = ?', (day, png))
+    return len(picks) + len(charts)
+
+  def bundle_hash(self, name):
+    """The Dropbox content hash of an archive bundle when it was imported, or None if it never was."""
+    with self.lock:
+      row = self.db.execute('SELECT hash FROM bundles WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else None
+
+  def mark_bundle(self, name, hash):
+    """Records that an archive bundle with the given content hash has been imported."""
+    with self.lock, self.db:
+      self.db.execute('INSERT OR REPLACE INTO bundles (name, hash) VALUES (?, ?)', (name, hash))
+
+  def import_bundle(self, bundle):
+    """Adds the picks and charts of an archive bundle that aren't stored yet, as already backed up."""
+    with self.lock:
+      known_picks = {r[0] for r in self.db.execute('SELECT day FROM picks')}
+      known_charts = {r[0] for r in self.db.execute('SELECT day FROM charts')}
+    for day in bundle.days():
+      if day not in known_picks:
+        self.put(day, bundle.pick(day), dirty=False)
+    for day in bundle.chart_days():
+      if day not in known_charts:
+        self.put_chart(day, bundle.chart(day), dirty=False)
+
+  def reconcile(self, dbx):
+    """
+    Brings the store in line with Dropbox at startup.
+    Picks and charts only on Dropbox are pulled in (charts just as posted markers),
+    anything only stored locally is left dirty for the next sync.
+    """
+    with self.lock:
+      known_picks = {r[0] for r in self.db.execute('SELECT day FROM picks')}
+      known_charts = {r[0] for r in self.db.execute('SELECT day FROM charts')}
+    for name in list_folder(dbx, self.prefix + '/charts'):
+      day = int(name.split('.')[0])
+      if day not in known_charts:
+        self.put_chart(day, None, dirty=False)
+    for name in list_folder(dbx, self.prefix + '/picks'):
+      day = int(name.split('.')[0])
+      if day not in known_picks:
+        with DROPBOX_SECONDS.timer(op='download'):
+          data = dbx.files_download(f"{self.prefix}/picks/{day}.txt")[1]
+        self.put(day, json.loads(data.content), dirty=False)
@@ -0,0 +1,84 @@
+import os, re, json, tempfile
+from datetime import timedelta
+import discord
+
+# The leaderboard bot posts an embed titled "New Submission ... *Puzzle Name*" with "by Someone was ..." in it
+TITLE = re.compile(r'New Submission.*?\*(.*)\*')
+SUBMITTER = re.compile(r'by (.*) was')
+
+def daily_of(timestamp, hour=12) -> int:
+  """The ordinal of the daily a UTC timestamp falls in, since dailies run from their announcement hour to the next."""
+  return (timestamp - timedelta(hours=hour)).toordinal()
+
+class SubmissionIndex():
+  """
+  Index of leaderboard bot submissions by daily and puzzle, built from messages as they arrive.
+  Persisted to disk along with the last indexed message of each channel, so a restart only catches up from there.
+  """
+  def __init__(self, path='submissions.json', bot_id=None, keep=30, hour=12):
+    self.path = path
+    self.bot_id = bot_id
+    self.keep = keep
+    self.hour = hour
+    self.index = {}
+    self.last = {}
+    try:
+      with open(path, 'r') as file:
+        data = json.load(file)
+    except (FileNotFoundError, ValueError):
+      return
+    for key, names in data['index'].items():
+      day, puzzle = key.split('/', 1)
+      self.index[int(day), puzzle] = set(names)
+    self.last = {int(k): v for k, v in data['last'].items()}
+
+  def save(self):
+    """Writes the index atomically, dropping days older than `keep` dailies before the latest."""
+    if self.index:
+      newest = max(day for day, _ in self.index)
+      self.index = {k: v for k, v in self.index.items() if k[0] > newest - self.keep}
+    data = {'index': {f'{day}/{puzzle}': sorted(names) for (day, puzzle), names in self.index.items()},
+            'last': self.last}
+    fd, temp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+    with os.fdopen(fd, 'w') as file:
+      json.dump(data, file)
+    os.replace(temp, self.path)
+
+  def parse(self, message):
+    """Returns (puzzle, submitter) if the message is a leaderboard bot submission, else None."""
+    if self.bot_id is not None and message.author.id != self.bot_id:
+      return None
+    if not message.embeds or not message.embeds[0].title or not message.embeds[0].description:
+      return None
+    title = TITLE.search(message.embeds[0].title)
+    submitter = SUBMITTER.search(message.embeds[0].description)
+    if not title or not submitter:
+      return None
+    return title.group(1), submitter.group(1)
+
+  def add(self, message, save=True) -> bool:
+    """Indexes a message if it is a submission, returning whether it was one."""
+    self.last[message.channel.id] = max(self.last.get(message.channel.id, 0), message.id)
+    parsed = self.parse(message)
+    if parsed is None:
+      return False
+    puzzle, submitter = parsed
+    self.index.setdefault((daily_of(message.created_at, self.hour), puzzle), set()).add(submitter)
+    if save:
+      self.save()
+    return True
+
+  def submitters(self, day, puzzle) -> set:
+    """The submitters on a puzzle during a daily."""
+    return self.index.get((day, puzzle), set())
+
+  async def catch_up(self, channel, limit=1000):
+    """
+    Indexes the messages a channel got while the bot wasn't listening.
+    Only messages after the last indexed one are read, `limit` bounds the first scan of a channel.
+    """
+    last = self.last.get(channel.id)
+    after = discord.Object(id=last) if last else None
+    async for message in channel.history(limit=None if last else limit, after=after, oldest_first=bool(last)):
+      self.add(message, save=False)
+    self.save()
@@ -0,0 +1,99 @@
+import math
+
+import pytest
+
+import archive
+import bench
+import store
+
+PICK = {'day': 738000, 'puzzle': {'id': 'P007', 'displayName': 'Stabilized Water'}, 'category': 'GC',
+        'min_flag': 'A', 'flags': 'T', 'manifold': 'V', 'cat_long': ['cost', 'cycles'], 'min_long': 'area',
+        'cat_link': ['g', 'c'], 'min_link': 'a', 'min_score': 5,
+        'start_scores': [[40, 12], [55, 9.5], [70, math.inf]], 'end_scores': [[35, 12], [70, math.inf]]}
+
+def round_trip(pick) -> dict:
+  return archive.PickRecord.unpack(archive.PickRecord(pick).pack()).to_dict()
+
+def kinds(scores):
+  return [[type(v) for v in s] for s in scores]
+
+def test_round_trip_exact():
+  pick = round_trip(PICK)
+  assert pick == PICK
+  # Equal isn't enough, 12 and 12.0 compare equal but would show up differently in a post
+  for name in ('start_scores', 'end_scores'):
+    assert kinds(pick[name]) == kinds(PICK[name])
+
+def test_round_trip_empty_and_missing_scores():
+  pick = dict(PICK, start_scores=[])
+  del pick['end_scores']
+  assert round_trip(pick) == pick
+
+def test_round_trip_explicit_none():
+  pick = dict(PICK, min_score=None, end_scores=None)
+  assert round_trip(pick) == pick
+
+def test_round_trip_extra_attributes():
+  pick = dict(PICK, submitters=['someone'], note=None)
+  assert round_trip(pick) == pick
+
+def test_pack_unpack_scores():
+  scores = [[1, 2.5, math.inf], [0, -3, 1e300]]
+  data = b'xx' + archive.pack_scores(scores)
+  unpacked, offset = archive.unpack_scores(data, 2)
+  assert unpacked == scores and kinds(unpacked) == kinds(scores)
+  assert offset == len(data)
+  assert archive.unpack_scores(archive.pack_scores([]))[0] == []
+
+@pytest.fixture
+def bundle_path(tmp_path):
+  path = str(tmp_path / '2021-07.bin')
+  picks = {738000: PICK, 738001: dict(PICK, day=738001, end_scores=[])}
+  archive.write_bundle(path, picks, {738000: b'\x89PNG chart', 738001: None})
+  return path
+
+def check_bundle(bundle):
+  assert bundle.days() == [738000, 738001]
+  assert bundle.chart_days() == [738000]
+  assert bundle.pick(738000) == PICK
+  assert bundle.pick(738001)['end_scores'] == []
+  assert bundle.chart(738000) == b'\x89PNG chart'
+  assert bundle.pick(737999) is None and bundle.chart(738001) is None
+
+def test_bundle_from_mmapped_file(bundle_path):
+  with archive.Bundle(bundle_path) as bundle:
+    check_bundle(bundle)
+
+def test_bundle_from_bytes(bundle_path):
+  with open(bundle_path, 'rb') as file:
+    with archive.Bundle(file.read()) as bundle:
+      check_bundle(bundle)
+
+def test_not_a_bundle():
+  with pytest.raises(ValueError):
+    archive.Bundle(b'nope' + bytes(8))
+
+def test_restore_skips_imported_bundles(bundle_path, tmp_path):
+  dbx = bench.FakeDropbox()
+  with open(bundle_path, 'rb') as file:
+    dbx.files['/archive/2021-07.bin'] = file.read()
+  db = store.Store(str(tmp_path / 'picks.db'))
+  archive.restore(dbx, db)
+  assert db.get(738000) == PICK
+  assert db.last_posted() == 738000
+  downloads = dbx.calls
+  archive.restore(dbx, db)
+  # Only the listing, the unchanged bundle isn't downloaded again
+  assert dbx.calls == downloads + 1
+  archive.write_bundle(bundle_path, {738002: dict(PICK, day=738002)})
+  with open(bundle_path, 'rb') as file:
+    dbx.files['/archive/2021-07.bin'] = file.read()
+  archive.restore(dbx, db)
+  assert db.get(738002) == dict(PICK, day=738002)
+
+def test_list_folder_follows_pages():
+  dbx = bench.FakeDropbox(page=3)
+  for day in range(10):
+    dbx.files[f'/picks/{day}.txt'] = b'{}'
+  assert sorted(store.list_folder(dbx, '/picks')) == sorted(f'{day}.txt' for day in range(10))
+  assert dbx.calls == 4
@@ -0,0 +1,29 @@
+import resource
+
+import pytest
+
+import charts
+
+POINTS = {'dead': [(10, 90), (40, 60)], 'keep': [(20, 70), (80, 20)], 'new': [(15, 65)], 'gone': [(30, 50)]}
+
+def rss_mb() -> float:
+  """Peak resident set size of this process so far, in MB (ru_maxrss is in KB on Linux)."""
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def test_render_png():
+  png = charts.render('title', 'G', 'C', **POINTS)
+  assert png.startswith(b'\x89PNG')
+
+def test_render_empty():
+  assert charts.render('title', 'G', 'C').startswith(b'\x89PNG')
+
+@pytest.mark.slow
+def test_memory_flat_over_1000_renders():
+  # A few renders first, so that matplotlib's fonts and caches are loaded before measuring
+  for _ in range(20):
+    charts.render('title', 'G', 'C', **POINTS)
+  before = rss_mb()
+  for _ in range(1000):
+    charts.render('title', 'G', 'C', **POINTS)
+  # The figures used to pile up in pyplot, at roughly a megabyte each
+  assert rss_mb() - before < 20
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+import frontier
+
+INFINITIES = ['∞', 'Infinity']
+
+def pareto_compare(a, b) -> bool:
+  """The old pairwise check, copied from main.py as it was before frontier.py."""
+  if a == b:
+    return False
+  return all(z[0] >= z[1] for z in zip(a, b))
+
+def reference(records, columns, flags='', min_column=None):
+  """The old Pick.get_frontier filter over already fetched records, returning (scores, min_score)."""
+  records = tuple(filter(lambda x: all(x['score'][c] != None for c in columns), records))
+  if 'O' not in flags:
+    records = tuple(filter(lambda x: x['score']['overlap'] == False, records))
+  if 'T' in flags:
+    records = tuple(filter(lambda x: x['score']['trackless'] == True, records))
+  min_score = None
+  if min_column:
+    if not records:
+      return [], None
+    min_score = min(np.inf if r['score'][min_column] in INFINITIES else r['score'][min_column] for r in records)
+    records = tuple(filter(lambda x: x['score'][min_column] == min_score, records))
+  scores = sorted(set(tuple(np.inf if r['score'][c] in INFINITIES else r['score'][c] for c in columns) for r in records))
+  return [a for a in scores if not any(pareto_compare(a, b) for b in scores)], min_score
+
+def generate(rng, size, metrics='abcd', none=0.1, infinite=0.1):
+  """Random records over a small value range so that ties and duplicates are common."""
+  records = []
+  for _ in range(size):
+    score = {}
+    for m in metrics:
+      roll = rng.random()
+      if roll < none:
+        score[m] = None
+      elif roll < none + infinite:
+        score[m] = INFINITIES[int(rng.integers(2))]
+      else:
+        score[m] = int(rng.integers(1, 12))
+    score['overlap'] = bool(rng.random() < 0.2)
+    score['trackless'] = bool(rng.random() < 0.3)
+    records.append({'score': score})
+  return records
+
+def finite_min(records, column):
+  """Records with the min metric always set and finite, where the old filter's comparisons hold."""
+  for r in records:
+    if r['score'][column] is None or r['score'][column] in INFINITIES:
+      r['score'][column] = 6
+  return records
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('flags', ['', 'O', 'T', 'OT'])
+@pytest.mark.parametrize('columns', [['a', 'b'], ['a', 'b', 'c'], ['a', 'b', 'c', 'd']])
+def test_matches_pareto_compare(seed, flags, columns):
+  records = generate(np.random.default_rng(seed), 60)
+  assert frontier.Records(records).frontier(columns, flags) == reference(records, columns, flags)
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('flags', ['c', 'Oc', 'Tc'])
+def test_min_flag_matches_pareto_compare(seed, flags):
+  records = finite_min(generate(np.random.default_rng(seed), 60), 'c')
+  assert frontier.Records(records).frontier(['a', 'b'], flags, 'c') == reference(records, ['a', 'b'], flags, 'c')
+
+def test_infinite_minimum_keeps_frontier():
+  # The old filter compared the raw '∞' with np.inf and always came up empty here, the new one keeps the frontier
+  records = [{'score': {'a': a, 'b': b, 'c': c, 'overlap': False, 'trackless': False}}
+             for a, b, c in [(1, 5, '∞'), (5, 1, 'Infinity'), (6, 6, '∞')]]
+  assert reference(records, ['a', 'b'], '', 'c') == ([], np.inf)
+  assert frontier.Records(records).frontier(['a', 'b'], '', 'c') == ([(1, 5), (5, 1)], np.inf)
+
+def test_infinite_scores_are_inf():
+  records = [{'score': {'a': 1, 'b': '∞', 'overlap': False, 'trackless': False}},
+             {'score': {'a': 2, 'b': 3, 'overlap': False, 'trackless': False}}]
+  assert frontier.Records(records).frontier(['a', 'b']) == ([(1, np.inf), (2, 3)], None)
+
+def test_unavailable_metric():
+  records = [{'score': {'a': 1, 'b': None, 'overlap': False, 'trackless': False}}]
+  table = frontier.Records(records)
+  assert 'b' not in table.available
+  assert table.frontier(['a', 'b']) == ([], None)
+
+def test_skyline_ignores_nan_and_duplicates():
+  points = [[1, 2], [1, 2], [2, 1], [np.nan, 0], [2, 2]]
+  assert sorted(frontier.skyline(points)) == [0, 2]
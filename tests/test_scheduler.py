@@ -0,0 +1,139 @@
+import json, asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import daily
+import scheduler
+import store
+
+def config(tmp_path, name='test'):
+  config = daily.Config(name, 1, 2, 3, hour=0)
+  config.db = store.Store(str(tmp_path / f'{name}.db'))
+  return config
+
+def slot(ordinal, hour=0) -> datetime:
+  """When a day is announced, at the daily's hour."""
+  return datetime.fromordinal(ordinal).replace(tzinfo=timezone.utc) + timedelta(hours=hour)
+
+def run(sched, seconds):
+  async def main():
+    task = asyncio.create_task(sched.run())
+    await asyncio.sleep(seconds)
+    task.cancel()
+  asyncio.run(main())
+
+def test_failed_announcement_resumes_without_reposting_results(tmp_path, monkeypatch):
+  monkeypatch.setattr(scheduler, 'RETRY', 0)
+  c = config(tmp_path)
+  sent = []
+
+  async def dispatch(config, ordinal):
+    db = config.store()
+    if not db.posted(ordinal - 1, 'results'):
+      sent.append('results')
+      db.put_chart(ordinal - 1, b'png')
+      db.mark_posted(ordinal - 1, 'results')
+    sent.append('announcement')
+    if sent.count('announcement') < 3:
+      raise RuntimeError('embed too long')
+    db.mark_posted(ordinal, 'announcement')
+
+  sched = scheduler.Scheduler([c], dispatch)
+  run(sched, 0.5)
+  assert sent == ['results', 'announcement', 'announcement', 'announcement']
+  # Done for today, the next one is tomorrow
+  today = datetime.now(timezone.utc).toordinal()
+  assert [q[0] for q in sched.queue] == [slot(today + 1)]
+
+def test_retries_are_capped(tmp_path, monkeypatch):
+  monkeypatch.setattr(scheduler, 'RETRY', 0)
+  c = config(tmp_path)
+  attempts = []
+
+  async def dispatch(config, ordinal):
+    attempts.append(ordinal)
+    raise RuntimeError('always fails')
+
+  sched = scheduler.Scheduler([c], dispatch)
+  run(sched, 0.5)
+  assert len(attempts) == scheduler.MAX_ATTEMPTS
+  today = datetime.now(timezone.utc).toordinal()
+  assert [q[0] for q in sched.queue] == [slot(today + 1)]
+
+def test_retry_keeps_the_next_slot(tmp_path, monkeypatch):
+  # Retried a second late, which used to push every later announcement back by as much
+  monkeypatch.setattr(scheduler, 'RETRY', 1)
+  c = config(tmp_path)
+  attempts = []
+
+  async def dispatch(config, ordinal):
+    attempts.append(ordinal)
+    if len(attempts) == 1:
+      raise RuntimeError('discord hiccup')
+    config.store().mark_posted(ordinal - 1, 'results')
+    config.store().mark_posted(ordinal, 'announcement')
+
+  sched = scheduler.Scheduler([c], dispatch)
+  run(sched, 1.5)
+  today = datetime.now(timezone.utc).toordinal()
+  assert attempts == [today, today]
+  assert [(q[0], q[3]) for q in sched.queue] == [(slot(today + 1), today + 1)]
+
+def test_pending_announcement_is_due_today(tmp_path):
+  c = config(tmp_path)
+  now = datetime.now(timezone.utc)
+  today = now.toordinal()
+  c.db.put_chart(today - 1, b'png')
+  # Results posted by an older version, with no post markers, count as today being done
+  assert c.next_announcement(now).toordinal() == today + 1
+  c.db.mark_posted(today - 1, 'results')
+  assert c.next_announcement(now).toordinal() == today
+  c.db.mark_posted(today, 'announcement')
+  assert c.next_announcement(now).toordinal() == today + 1
+
+def test_posts_keep_their_message(tmp_path):
+  path = str(tmp_path / 'old.db')
+  # A store from before message IDs were kept
+  old = store.Store(path)
+  old.db.execute('DROP TABLE posts')
+  old.db.execute('CREATE TABLE posts (day INTEGER NOT NULL, kind TEXT NOT NULL, PRIMARY KEY (day, kind))')
+  old.db.execute("INSERT INTO posts VALUES (1, 'announcement')")
+  old.db.commit()
+  db = store.Store(path)
+  assert db.posted(1, 'announcement') and db.message(1, 'announcement') is None
+  db.mark_posted(2, 'announcement', 1234)
+  assert db.message(2, 'announcement') == 1234
+  # A reroll posts the announcement again
+  db.mark_posted(2, 'announcement', 5678)
+  assert db.message(2, 'announcement') == 5678
+  assert db.message(3, 'announcement') is None
+
+ENTRY = {'name': 'other', 'guild': '1', 'channel': 2, 'thread': 3, 'hour': 18}
+
+def test_load_dailies(tmp_path):
+  path = tmp_path / 'dailies.json'
+  path.write_text(json.dumps([ENTRY, {'name': 'default', 'guild': 4, 'channel': 5, 'thread': 6, 'hour': 6}]))
+  default = daily.Config()
+  dailies = scheduler.load_dailies(str(path), default)
+  assert [c.name for c in dailies] == ['default', 'other']
+  # The default daily is updated in place
+  assert dailies[0] is default and default.hour == 6 and default.guild == 4
+  assert dailies[1].hour == 18 and dailies[1].guild == 1
+
+@pytest.mark.parametrize('change', [
+  {'hour': 24},
+  {'groups': {'CHAPTER': 0, 'JOURNAL': 0}},
+  {'groups': {'CHAPTER': -1, 'JOURNAL': 2}},
+  {'categories': {'NORMAL': {'G': 1, 'C': 1}}},
+  {'categories': {'PRODUCTION': {'G': 1, 'C': 1, 'A': 0, 'I': 0}, 'NORMAL': {'G': 1, 'C': 1, 'A': 1}}},
+  {'categories': {'PRODUCTION': {'G': 1, 'C': 1, 'H': 0, 'W': 0, 'A': 0, 'I': 0}}},
+  {'categories': {'NORMAL': {'G': 1, 'C': 1, 'A': 1, 'X': 1}}},
+])
+def test_invalid_weights_are_rejected(change):
+  with pytest.raises(ValueError):
+    daily.Config.from_dict(dict(ENTRY, **change))
+
+def test_partial_category_weights_keep_defaults():
+  config = daily.Config.from_dict(dict(ENTRY, categories={'NORMAL': {'G': 1, 'C': 1, 'A': 1}}))
+  assert config.categories['PRODUCTION'] == daily.Config.CATEGORIES['PRODUCTION']
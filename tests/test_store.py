@@ -0,0 +1,20 @@
+import store
+
+def test_days_by_puzzle_and_category(tmp_path):
+  db = store.Store(str(tmp_path / 'picks.db'))
+  db.put(3, {'puzzle': {'id': 'alpha'}, 'category': 'GC'})
+  db.put(1, {'puzzle': {'id': 'alpha'}, 'category': 'CA'})
+  db.put(2, {'puzzle': {'id': 'beta'}, 'category': 'GC'})
+  assert db.days_for_puzzle('alpha') == [1, 3]
+  assert db.days_for_category('GC') == [2, 3]
+  assert db.days_for_puzzle('gamma') == []
+  # A repick replaces the day's row rather than adding to it
+  db.put(3, {'puzzle': {'id': 'beta'}, 'category': 'GC'})
+  assert db.days_for_puzzle('alpha') == [1]
+  assert db.days_for_puzzle('beta') == [2, 3]
+
+def test_lookups_use_the_indexes(tmp_path):
+  db = store.Store(str(tmp_path / 'picks.db'))
+  for column, index in (('puzzle', 'picks_puzzle'), ('category', 'picks_category')):
+    plan = db.db.execute(f'EXPLAIN QUERY PLAN SELECT day FROM picks WHERE {column} = ? ORDER BY day', ('x',)).fetchall()
+    assert any(index in row[-1] for row in plan)
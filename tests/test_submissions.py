@@ -0,0 +1,96 @@
+import json, asyncio, types
+from datetime import datetime, timezone
+
+import submissions
+
+BOT = 42
+HOUR = 18
+
+def message(id, puzzle='Stabilized Water', submitter='someone', author=BOT, channel=1,
+            created_at=datetime(2023, 5, 1, 20, tzinfo=timezone.utc)):
+  embed = types.SimpleNamespace(title=f'New Submission: *{puzzle}*', description=f'by {submitter} was accepted')
+  return types.SimpleNamespace(id=id, author=types.SimpleNamespace(id=author), channel=types.SimpleNamespace(id=channel),
+                               created_at=created_at, embeds=[embed])
+
+class Channel():
+  """Stand-in for a Discord channel whose history honours limit, after and oldest_first like discord.py's."""
+  def __init__(self, messages, id=1):
+    self.id = id
+    self.messages = messages
+    self.reads = []
+
+  async def history(self, limit=100, after=None, oldest_first=False):
+    messages = sorted((m for m in self.messages if after is None or m.id > after.id), key=lambda m: m.id)
+    if not oldest_first:
+      messages.reverse()
+    # Each read as the message it started after, and the messages it got
+    self.reads.append((after.id if after else None, [m.id for m in messages[:limit]]))
+    for m in messages[:limit]:
+      yield m
+
+def index(tmp_path, **kwargs) -> submissions.SubmissionIndex:
+  return submissions.SubmissionIndex(str(tmp_path / 'submissions.json'), BOT, hour=HOUR, **kwargs)
+
+def test_parses_leaderboard_submissions(tmp_path):
+  i = index(tmp_path)
+  assert i.parse(message(1, 'Face Powder', 'Jane Doe')) == ('Face Powder', 'Jane Doe')
+  # Anyone can post an embed that looks like one
+  assert i.parse(message(2, author=7)) is None
+  m = message(3)
+  m.embeds = []
+  assert i.parse(m) is None
+  m = message(4)
+  m.embeds[0].title = 'Frontier moved'
+  assert i.parse(m) is None
+  m = message(5)
+  m.embeds[0].description = None
+  assert i.parse(m) is None
+  # Without a bot ID, submissions are taken from any author
+  assert submissions.SubmissionIndex(str(tmp_path / 'any.json')).parse(message(6, author=7)) == ('Stabilized Water', 'someone')
+
+def test_daily_of_turns_over_at_the_hour():
+  day = datetime(2023, 5, 1, tzinfo=timezone.utc)
+  ordinal = day.toordinal()
+  assert submissions.daily_of(day.replace(hour=HOUR - 1, minute=59, second=59), HOUR) == ordinal - 1
+  assert submissions.daily_of(day.replace(hour=HOUR), HOUR) == ordinal
+  assert submissions.daily_of(day.replace(hour=23, minute=59), HOUR) == ordinal
+  assert submissions.daily_of(day, 0) == ordinal
+
+def test_submissions_count_for_the_daily_they_fall_in(tmp_path):
+  i = index(tmp_path)
+  day = datetime(2023, 5, 1, tzinfo=timezone.utc)
+  assert i.add(message(1, submitter='early', created_at=day.replace(hour=HOUR - 1)))
+  assert i.add(message(2, submitter='late', created_at=day.replace(hour=HOUR)))
+  assert not i.add(message(3, author=7))
+  assert i.submitters(day.toordinal() - 1, 'Stabilized Water') == {'early'}
+  assert i.submitters(day.toordinal(), 'Stabilized Water') == {'late'}
+  # Non-submissions still move the channel along
+  assert i.last == {1: 3}
+
+def test_save_keeps_recent_days(tmp_path):
+  i = index(tmp_path, keep=3)
+  newest = datetime(2023, 5, 10, HOUR, tzinfo=timezone.utc)
+  for n in range(5):
+    i.add(message(n + 1, submitter=f's{n}', created_at=newest.replace(day=10 - n)), save=False)
+  i.save()
+  days = sorted(day for day, _ in i.index)
+  assert days == [newest.toordinal() - 2, newest.toordinal() - 1, newest.toordinal()]
+  # The pruned index is what a restart loads
+  reloaded = index(tmp_path)
+  assert reloaded.index == i.index and reloaded.last == {1: 5}
+  with open(tmp_path / 'submissions.json') as file:
+    assert len(json.load(file)['index']) == 3
+
+def test_catch_up_resumes_after_the_last_message(tmp_path):
+  channel = Channel([message(n) for n in range(1, 6)])
+  i = index(tmp_path)
+  # The first scan of a channel only goes back `limit` messages
+  asyncio.run(i.catch_up(channel, limit=3))
+  assert i.last == {1: 5}
+  channel.messages += [message(6, submitter='new'), message(7, submitter='newer')]
+  # After a restart, only what came in since is read
+  i = index(tmp_path)
+  asyncio.run(i.catch_up(channel))
+  assert channel.reads == [(None, [5, 4, 3]), (5, [6, 7])]
+  assert i.last == {1: 7}
+  assert i.submitters(datetime(2023, 5, 1, 20).toordinal(), 'Stabilized Water') == {'someone', 'new', 'newer'}
@@ -0,0 +1,25 @@
+import asyncio
+
+import daily
+import tracker
+
+def test_poll_survives_failing_dailies(monkeypatch):
+  broken, fine = daily.Config('broken'), daily.Config('fine')
+  calls = []
+
+  def stored(ordinal, config):
+    calls.append(config.name)
+    if config is broken:
+      raise ValueError('bad pick json')
+    return None
+
+  monkeypatch.setattr(tracker.Pick, 'stored', stored)
+
+  async def main():
+    task = asyncio.create_task(tracker.poll(0.01, None, [broken, fine]))
+    await asyncio.sleep(0.2)
+    assert not task.done()
+    task.cancel()
+
+  asyncio.run(main())
+  assert calls.count('broken') > 1 and calls.count('fine') > 1
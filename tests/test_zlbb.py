@@ -0,0 +1,144 @@
+import os, time, asyncio
+
+import aiohttp
+import pytest
+
+import bench
+import zlbb
+
+RECORDS = {'tiny': [{'score': {'cost': 10, 'cycles': 20, 'overlap': False, 'trackless': False}}]}
+PUZZLES = '/om/puzzles'
+TINY = '/om/puzzle/tiny/records'
+
+@pytest.fixture
+def stand_in(monkeypatch, tmp_path):
+  with bench.StandIn(RECORDS) as stand_in:
+    monkeypatch.setattr(zlbb, 'ZLBB_URL', stand_in.url)
+    monkeypatch.setattr(zlbb, 'cache', zlbb.Cache(str(tmp_path / 'cache')))
+    yield stand_in
+
+def later(monkeypatch, seconds):
+  """Moves the clock the cache sees forward."""
+  now = time.time()
+  monkeypatch.setattr(zlbb.time, 'time', lambda: now + seconds)
+
+def test_miss_then_hit(stand_in):
+  assert zlbb.get_json(TINY) == RECORDS['tiny']
+  assert zlbb.get_json(TINY) == RECORDS['tiny']
+  assert stand_in.requests == 1
+  assert zlbb.cache.stats() == {'hits': 1, 'misses': 1, 'revalidated': 0, 'evictions': 0}
+
+def test_ttl_per_endpoint(stand_in, monkeypatch):
+  zlbb.get_json(PUZZLES)
+  zlbb.get_json(TINY)
+  # Records go stale after a minute, the puzzle list only after a day
+  later(monkeypatch, 120)
+  zlbb.get_json(PUZZLES)
+  zlbb.get_json(TINY)
+  assert stand_in.requests == 3
+  assert zlbb.cache.hits == 1
+
+def test_revalidate_with_etag(stand_in, monkeypatch):
+  zlbb.get_json(TINY)
+  later(monkeypatch, 120)
+  assert zlbb.get_json(TINY) == RECORDS['tiny']
+  assert stand_in.headers['If-None-Match'] == stand_in.etags[TINY]
+  assert zlbb.cache.revalidated == 1
+  # A revalidated entry is fresh again
+  zlbb.get_json(TINY)
+  assert stand_in.requests == 2
+
+def test_revalidate_with_last_modified(monkeypatch, tmp_path):
+  with bench.StandIn(RECORDS, etags=False) as stand_in:
+    monkeypatch.setattr(zlbb, 'ZLBB_URL', stand_in.url)
+    monkeypatch.setattr(zlbb, 'cache', zlbb.Cache(str(tmp_path / 'cache')))
+    zlbb.get_json(TINY)
+    later(monkeypatch, 120)
+    assert zlbb.get_json(TINY) == RECORDS['tiny']
+    assert 'If-None-Match' not in stand_in.headers
+    assert stand_in.headers['If-Modified-Since'] == stand_in.last_modified
+    assert zlbb.cache.stats()['revalidated'] == 1
+
+def test_reload_bypasses_cache(stand_in):
+  zlbb.get_json(TINY)
+  assert zlbb.get_json(TINY, reload=True) == RECORDS['tiny']
+  assert stand_in.requests == 2
+  assert 'If-None-Match' not in stand_in.headers
+  # The reloaded response is still stored
+  zlbb.get_json(TINY)
+  assert stand_in.requests == 2
+
+def test_lru_eviction(tmp_path):
+  cache = zlbb.Cache(str(tmp_path))
+  cache.put('a', 'x' * 100, {})
+  # Room for two entries but not three
+  cache.max_bytes = 2 * os.path.getsize(cache.path('a')) + 10
+  cache.put('b', 'y' * 100, {})
+  # a was used more recently than b, so b goes first
+  now = time.time()
+  os.utime(cache.path('a'), (now + 10, now + 10))
+  os.utime(cache.path('b'), (now - 10, now - 10))
+  cache.put('c', 'z' * 100, {})
+  assert cache.get('b') is None
+  assert cache.get('a')['data'] == 'x' * 100
+  assert cache.get('c')['data'] == 'z' * 100
+  assert cache.evictions == 1
+
+def test_failed_write_leaves_no_temp_file(tmp_path):
+  cache = zlbb.Cache(str(tmp_path))
+  cache.put('a', [1, 2], {})
+  with pytest.raises(TypeError):
+    cache.put('a', object(), {})
+  assert os.listdir(tmp_path) == [os.path.basename(cache.path('a'))]
+  assert cache.get('a')['data'] == [1, 2]
+
+def fetch(*paths, **kwargs) -> list:
+  """Gets paths concurrently through a fresh async client, which is closed again afterwards."""
+  async def main():
+    client = zlbb.Client(backoff=0, **kwargs)
+    try:
+      return await asyncio.gather(*(client.get_json(p) for p in paths))
+    finally:
+      await client.close()
+  return asyncio.run(main())
+
+def test_client_retries_server_errors(stand_in):
+  stand_in.statuses = [503, 429, 500]
+  assert fetch(TINY, retries=3) == [RECORDS['tiny']]
+  assert stand_in.requests == 4
+  assert zlbb.cache.misses == 1
+
+def test_client_gives_up_after_retries(stand_in):
+  stand_in.statuses = [502] * 10
+  with pytest.raises(aiohttp.ClientResponseError) as error:
+    fetch(TINY, retries=2)
+  assert error.value.status == 502
+  assert stand_in.requests == 3
+
+@pytest.mark.parametrize('status', [400, 403, 404])
+def test_client_does_not_retry_client_errors(stand_in, status):
+  stand_in.statuses = [status]
+  with pytest.raises(aiohttp.ClientResponseError) as error:
+    fetch(TINY, retries=3)
+  assert error.value.status == status
+  assert stand_in.requests == 1
+
+def test_client_joins_requests_in_flight(stand_in):
+  stand_in.delay = 0.2
+  assert fetch(TINY, TINY, TINY, PUZZLES) == [RECORDS['tiny']] * 3 + [bench.puzzles(RECORDS)]
+  assert stand_in.requests == 2
+
+def test_client_cancelled_caller_leaves_the_fetch_running(stand_in):
+  stand_in.delay = 0.2
+  async def main():
+    client = zlbb.Client(backoff=0)
+    try:
+      first = asyncio.create_task(client.get_json(TINY))
+      second = asyncio.create_task(client.get_json(TINY))
+      await asyncio.sleep(0.05)
+      first.cancel()
+      return await second, client.inflight
+    finally:
+      await client.close()
+  assert asyncio.run(main()) == (RECORDS['tiny'], {})
+  assert stand_in.requests == 1
@@ -0,0 +1,34 @@
+import asyncio
+from datetime import datetime, timezone
+
+import daily
+import submissions
+from daily import Pick
+from metrics import log
+
+async def poll(interval=600, on_move=None, dailies=(daily.default,)):
+  """
+  Refreshes the running frontier of every daily every `interval` seconds, storing only how it moved.
+  Dailies on the same puzzle share one records fetch.
+  If given, on_move is awaited with the pick and the added and dominated points whenever one does.
+  A daily failing to refresh, for whatever reason, is logged and tried again on the next round.
+  """
+  loop = asyncio.get_running_loop()
+
+  async def refresh(config):
+    pick = await loop.run_in_executor(None, Pick.stored, submissions.daily_of(datetime.now(timezone.utc), config.hour), config)
+    if pick is None:
+      return
+    # Unchanged records are only revalidated with zlbb, not downloaded again
+    added, dominated = pick.track(pick.get_frontier(await pick.get_records_async()))
+    if added or dominated:
+      await loop.run_in_executor(None, pick.save)
+      if on_move is not None:
+        await on_move(pick, added, dominated)
+
+  while True:
+    await asyncio.sleep(interval)
+    results = await asyncio.gather(*(refresh(c) for c in dailies), return_exceptions=True)
+    for config, result in zip(dailies, results):
+      if isinstance(result, Exception):
+        log.error('Tracking %s failed', config.name, exc_info=result)
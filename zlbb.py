@@ -0,0 +1,230 @@
+import os, json, re, time, random, hashlib, tempfile
+import asyncio
+import aiohttp
+import requests
+
+import metrics
+
+# The base URL can be pointed elsewhere, e.g. at a local stand-in for testing
+ZLBB_URL = os.environ.get('ZLBB_URL', 'https://zlbb.faendir.com')
+CACHE_DIR = '.zlbb_cache'
+
+# Seconds a cached response is used as-is, matched against the request path in order.
+# The puzzle list rarely changes, while records move whenever someone submits.
+TTLS = ((re.compile(r'^/om/puzzles$'), 24 * 60 * 60),
+        (re.compile(r'^/om/puzzle/[^/]+/records'), 60))
+DEFAULT_TTL = 60
+
+REQUEST_SECONDS = metrics.histogram('zlbb_request_seconds', 'Time to get a zlbb endpoint, cache hits included.')
+RESPONSE_BYTES = metrics.histogram('zlbb_response_bytes', 'Size of zlbb response bodies.', (1e3, 1e4, 1e5, 1e6, 1e7))
+CACHE_EVENTS = metrics.counter('zlbb_cache_events_total', 'zlbb cache hits, misses, revalidations and evictions.')
+
+def endpoint(path) -> str:
+  """A label for a zlbb path that doesn't grow with the number of puzzles, e.g. 'records'."""
+  return 'records' if '/records' in path else path.split('?')[0]
+
+class Cache():
+  """
+  On-disk cache of zlbb JSON responses, one file per URL.
+  Stale entries are revalidated with ETag/Last-Modified when zlbb provided them,
+  and the least recently used entries are evicted once the cache grows past max_bytes.
+  """
+  def __init__(self, directory=CACHE_DIR, max_bytes=64 * 1024 * 1024, ttls=TTLS):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.ttls = ttls
+    self.hits = 0
+    self.misses = 0
+    self.revalidated = 0
+    self.evictions = 0
+
+  def stats(self) -> dict:
+    """Counters since the cache was created."""
+    return {'hits': self.hits, 'misses': self.misses, 'revalidated': self.revalidated, 'evictions': self.evictions}
+
+  def count(self, event):
+    """Counts a cache event: 'hits', 'misses', 'revalidated' or 'evictions'."""
+    setattr(self, event, getattr(self, event) + 1)
+    CACHE_EVENTS.inc(event=event)
+
+  def ttl(self, url) -> float:
+    """Looks up the time-to-live for a URL by its path."""
+    path = url[len(ZLBB_URL):] if url.startswith(ZLBB_URL) else url
+    for pattern, ttl in self.ttls:
+      if pattern.search(path):
+        return ttl
+    return DEFAULT_TTL
+
+  def path(self, url) -> str:
+    return os.path.join(self.directory, hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json')
+
+  def get(self, url):
+    """Returns the cached entry for a URL, or None. Reading an entry marks it as recently used."""
+    path = self.path(url)
+    try:
+      with open(path, 'r', encoding='utf-8') as file:
+        entry = json.load(file)
+      os.utime(path)
+    except FileNotFoundError:
+      return None
+    except (ValueError, OSError):
+      # Writes are atomic so this shouldn't happen, but an unreadable entry is just a miss
+      self.remove(path)
+      return None
+    return entry if entry.get('url') == url else None
+
+  def fresh(self, entry) -> bool:
+    return time.time() - entry['stored'] < self.ttl(entry['url'])
+
+  def conditional_headers(self, entry) -> dict:
+    """Request headers to revalidate a stale entry, empty if zlbb gave nothing to revalidate with."""
+    headers = {}
+    if entry and entry.get('etag'):
+      headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+      headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+  def put(self, url, data, headers):
+    """Stores a response body along with its validators, replacing the previous entry atomically."""
+    entry = {'url': url, 'stored': time.time(), 'etag': headers.get('ETag'),
+             'last_modified': headers.get('Last-Modified'), 'data': data}
+    os.makedirs(self.directory, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    try:
+      with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        json.dump(entry, file)
+        file.flush()
+        os.fsync(file.fileno())
+      os.replace(temp, self.path(url))
+    except BaseException:
+      self.remove(temp)
+      raise
+    self.evict()
+
+  def refresh(self, entry):
+    """Marks a stale entry as fresh again after zlbb answered 304 Not Modified."""
+    self.put(entry['url'], entry['data'], {'ETag': entry.get('etag'), 'Last-Modified': entry.get('last_modified')})
+
+  def evict(self):
+    """Removes the least recently used entries until the cache fits in max_bytes."""
+    entries = []
+    for name in os.listdir(self.directory):
+      if name.endswith('.json'):
+        stat = os.stat(os.path.join(self.directory, name))
+        entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(e[1] for e in entries)
+    for _, size, name in sorted(entries):
+      if total <= self.max_bytes:
+        break
+      self.remove(os.path.join(self.directory, name))
+      self.count('evictions')
+      total -= size
+
+  def remove(self, path):
+    try:
+      os.remove(path)
+    except FileNotFoundError:
+      pass
+
+cache = Cache()
+
+def get_json(path, reload=False):
+  """
+  Gets a zlbb endpoint (e.g. '/om/puzzles') as parsed JSON through the on-disk cache.
+  Setting reload skips the cache lookup, though the fresh response is still stored.
+  """
+  url = ZLBB_URL + path
+  with REQUEST_SECONDS.timer(endpoint=endpoint(path)):
+    entry = None if reload else cache.get(url)
+    if entry and cache.fresh(entry):
+      cache.count('hits')
+      return entry['data']
+    response = requests.get(url, headers=cache.conditional_headers(entry), timeout=30)
+    if response.status_code == 304 and entry:
+      cache.count('revalidated')
+      cache.refresh(entry)
+      return entry['data']
+    response.raise_for_status()
+    cache.count('misses')
+    RESPONSE_BYTES.observe(len(response.content), endpoint=endpoint(path))
+    data = response.json()
+    cache.put(url, data, response.headers)
+    return data
+
+class Client():
+  """
+  Async zlbb client for use inside the bot, so that fetches never block the Discord event loop.
+  All requests share one long-lived pooled session and the on-disk cache,
+  at most `limit` of them run at once, and failed requests are retried with jittered exponential backoff.
+  Concurrent requests for the same path share one fetch, so several dailies rolling at once cost a single request.
+  """
+  def __init__(self, limit=4, timeout=30, retries=3, backoff=0.5):
+    self.limit = limit
+    self.timeout = timeout
+    self.retries = retries
+    self.backoff = backoff
+    self.session = None
+    self.semaphore = None
+    self.inflight = {}
+
+  async def open(self):
+    """Creates the session on first use, since it has to belong to the running event loop."""
+    if self.session is None or self.session.closed:
+      self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                           connector=aiohttp.TCPConnector(limit=self.limit))
+      self.semaphore = asyncio.Semaphore(self.limit)
+    return self.session
+
+  async def close(self):
+    if self.session is not None:
+      await self.session.close()
+      self.session = None
+
+  async def get_json(self, path, reload=False):
+    """Async version of get_json, with the same caching behaviour."""
+    key = (path, reload)
+    if key not in self.inflight:
+      async def fetch():
+        try:
+          with REQUEST_SECONDS.timer(endpoint=endpoint(path)):
+            return await self.fetch(path, reload)
+        finally:
+          self.inflight.pop(key, None)
+      self.inflight[key] = asyncio.ensure_future(fetch())
+    # Shielded, so a caller being cancelled doesn't cancel the fetch for everyone else waiting on it
+    return await asyncio.shield(self.inflight[key])
+
+  async def fetch(self, path, reload):
+    loop = asyncio.get_running_loop()
+    url = ZLBB_URL + path
+    entry = None if reload else await loop.run_in_executor(None, cache.get, url)
+    if entry and cache.fresh(entry):
+      cache.count('hits')
+      return entry['data']
+    session = await self.open()
+    async with self.semaphore:
+      for attempt in range(self.retries + 1):
+        try:
+          async with session.get(url, headers=cache.conditional_headers(entry)) as response:
+            if response.status == 304 and entry:
+              cache.count('revalidated')
+              await loop.run_in_executor(None, cache.refresh, entry)
+              return entry['data']
+            response.raise_for_status()
+            body = await response.read()
+            cache.count('misses')
+            RESPONSE_BYTES.observe(len(body), endpoint=endpoint(path))
+            data = json.loads(body)
+            await loop.run_in_executor(None, cache.put, url, data, response.headers)
+            return data
+        except aiohttp.ClientResponseError as e:
+          # Only server errors and rate limiting are worth another try
+          if (e.status < 500 and e.status != 429) or attempt == self.retries:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+          if attempt == self.retries:
+            raise
+        await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+client = Client()